@@ -1,8 +1,21 @@
 import os
 import json
+import asyncio
+import hashlib
 import logging
 import discord
+from discord import app_commands
 from discord.ext import commands
+from core.cluster import launch, worker_shards
+from core.config import ConfigService
+from core.events import EventRouter
+from core.guilds import GuildConfig
+from core.lifecycle import Lifecycle, track_ui
+from core.loader import ExtensionLoader
+from core.metrics import Metrics, instrument_ui
+from core.pipeline import SendPipeline
+from core.reloader import ExtensionReloader
+from core.store import RequestStore
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,80 +27,215 @@ with open('settings.json', 'r', encoding='utf-8') as f:
     settings = json.load(f)
 BOT_TOKEN = settings['token']
 PREFIX = settings.get('prefix', '!')
+# Без префиксных команд бот обходится без intent'а message_content (остаются команды через упоминание)
+PREFIX_COMMANDS = settings.get('prefix_commands', True)
 
 intents = discord.Intents.default()
-intents.message_content = True
+intents.message_content = PREFIX_COMMANDS
 
-class ModularBot(commands.Bot):
+# Шардирование: воркер кластера получает свои шарды от лаунчера,
+# одиночный процесс может вести все шарды сам (shard_count в settings.json)
+SHARD_IDS, SHARD_COUNT = worker_shards()
+if SHARD_COUNT is None:
+    SHARD_COUNT = settings.get('shard_count')
+BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+
+# Профили кэшей discord.py; модулям нужны только роли и ID каналов, а не участники и сообщения
+MEMORY_PROFILES = {
+    'default': {},
+    'low': {
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'max_messages': None,
+        'chunk_guilds_at_startup': False,
+    },
+}
+
+def memory_options():
+    options = dict(MEMORY_PROFILES.get(settings.get('memory_profile', 'default'), {}))
+    if 'max_messages' in settings:
+        options['max_messages'] = settings['max_messages']
+    return options
+
+if settings.get('tracemalloc'):
+    # Снимки памяти для !memstats с самого старта
+    import tracemalloc
+    tracemalloc.start()
+
+class TrackedTree(app_commands.CommandTree):
+    """Дерево slash-команд с учётом задержки в метриках, как у префиксных команд в ModularBot.invoke"""
+    async def _call(self, interaction):
+        name = (interaction.data or {}).get('name', '')
+        command = self.client.get_command(name)
+        owner = command.cog.qualified_name if command and command.cog else 'bot'
+        with self.client.lifecycle.inflight():
+            async with self.client.metrics.track('command', owner, name):
+                await super()._call(interaction)
+
+class ModularBot(BotBase):
     def __init__(self):
+        options = memory_options()
+        if SHARD_COUNT:
+            options['shard_count'] = SHARD_COUNT
+        if SHARD_IDS is not None:
+            options['shard_ids'] = SHARD_IDS
         super().__init__(
-            command_prefix=commands.when_mentioned_or(PREFIX),
-            intents=intents
+            command_prefix=commands.when_mentioned_or(PREFIX) if PREFIX_COMMANDS else commands.when_mentioned,
+            intents=intents,
+            tree_cls=TrackedTree,
+            **options
         )
+        # Постоянное хранилище заявок (переживает перезапуск)
+        self.store = RequestStore(os.path.join(os.path.dirname(__file__), 'requests.db'))
+        # Общая конфигурация с отложенной записью; в кластере она хранится в общей базе
+        # и опрашивается на правки других воркеров
+        self.config = ConfigService(store=self.store if SHARD_IDS is not None else None,
+                                    poll=settings.get('config_watch_interval') or 1.0)
+        self.loader = ExtensionLoader(self)
+        self.reloader = ExtensionReloader(self, self.loader)
+        # Подписки cog'ов на события с фильтрами
+        self.router = EventRouter(self)
+        # Метрики команд, кнопок и модалов
+        self.metrics = Metrics()
+        instrument_ui(self.metrics)
+        # Остановка ждёт команды, кнопки и модалы в работе
+        self.lifecycle = Lifecycle(self)
+        track_ui(self.lifecycle)
+        self._shutdown_task = None
+
+    @property
+    def settings(self):
+        """Снимок settings.json только для чтения; менять через ``config.set('settings', ...)``"""
+        return self.config.data('settings')
+
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        owner = ctx.cog.qualified_name if ctx.cog else 'bot'
+        with self.lifecycle.inflight():
+            async with self.metrics.track('command', owner, ctx.command.qualified_name):
+                await super().invoke(ctx)
+
+    async def sync_commands(self):
+        """Синхронизировать slash-команды одним запросом, только если набор команд изменился"""
+        # В кластере дерево глобальное — синхронизирует только воркер с шардом 0
+        if SHARD_IDS is not None and 0 not in SHARD_IDS:
+            return False
+        payload = sorted((c.to_dict(self.tree) for c in self.tree.get_commands()), key=lambda c: c['name'])
+        digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        key = f'app_commands:{self.application_id}'
+        if self.store.meta_get(key) == digest:
+            return False
+        await self.tree.sync()
+        self.store.meta_set(key, digest)
+        logger.info(f"Synced {len(payload)} application commands")
+        return True
+
+    async def close(self):
+        # Сигнал и выход из ``async with`` вызывают close дважды: второй вызов ждёт первый
+        if self._shutdown_task is None:
+            self._shutdown_task = asyncio.ensure_future(self._shutdown())
+        await asyncio.shield(self._shutdown_task)
+
+    async def _shutdown(self):
+        # close() приходит и до setup_hook (неверный токен, Ctrl+C при входе): документов
+        # конфигурации и очереди ещё нет, а сессия HTTP всё равно должна закрыться
+        try:
+            self.lifecycle.closing = True
+            self.reloader.stop_watching()
+            self.metrics.close()
+            timeout = 10.0
+            if 'settings' in self.config:
+                timeout = self.config.get('settings', 'shutdown_timeout', timeout, type=float)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            # Сначала обработчики (они ещё ставят сообщения в очередь), потом сама очередь
+            await self.lifecycle.drain(deadline - loop.time())
+            if hasattr(self, 'pipeline'):
+                await self.pipeline.drain(deadline - loop.time())
+        finally:
+            try:
+                await super().close()
+            finally:
+                await self._save_state()
+
+    async def _save_state(self):
+        """Сохранить неотправленное и отложенные правки конфигурации, закрыть хранилище"""
+        try:
+            if hasattr(self, 'pipeline'):
+                unsent = self.pipeline.unsent()
+                if unsent:
+                    self.store.outbox_add([job.to_record() for job in unsent])
+                    logger.info(f'Saved {len(unsent)} unsent messages for replay')
+            await self.config.flush_all()
+        finally:
+            self.store.close()
+
+    async def replay_outbox(self):
+        """Поставить в очередь сообщения, не отправленные до прошлой остановки"""
+        done = self.pipeline.replay(self.store.outbox(), self.get_channel)
+        self.store.outbox_delete(done)
+        if done:
+            logger.info(f'Replayed {len(done)} messages saved at last shutdown')
 
     async def setup_hook(self):
         base_dir = os.path.dirname(__file__)
         # Create modules folder and default files
         modules_dir = os.path.join(base_dir, 'modules')
+        first_run = not os.path.isdir(modules_dir)
         os.makedirs(modules_dir, exist_ok=True)
         init_py = os.path.join(modules_dir, '__init__.py')
         if not os.path.exists(init_py): open(init_py, 'w').close()
-        # variables.json
+        # settings.json и variables.json
+        self.config.register('settings', os.path.join(base_dir, 'settings.json'))
         vars_path = os.path.join(modules_dir, 'variables.json')
-        default_vars = {'custom_var': 'value', 'another_var': 123}
-        if not os.path.exists(vars_path):
-            with open(vars_path, 'w', encoding='utf-8') as vf:
-                json.dump(default_vars, vf, indent=2, ensure_ascii=False)
-        # example module template
+        # Переменные модулей (modules.<модуль>) модули заводят сами при загрузке
+        self.config.register('variables', vars_path, default={})
+        # Настройки каждого сервера с индексом по ID гильдии
+        self.guild_config = GuildConfig(self)
+        watch = self.config.get('settings', 'config_watch_interval', 0, type=float)
+        if watch:
+            self.config.start_watching(watch)
+        # Очередь исходящих сообщений с ограничением темпа на канал
+        self.pipeline = SendPipeline(
+            queue_size=self.config.get('settings', 'send_queue_size', 100, type=int),
+            rate=self.config.get('settings', 'send_rate', 1.0, type=float),
+            burst=self.config.get('settings', 'send_burst', 5, type=int),
+        )
+        # example module template (только при первом запуске, удалённый пример не возвращается)
         example_path = os.path.join(modules_dir, 'example_module.py')
-        if not os.path.exists(example_path):
+        if first_run:
             with open(example_path, 'w', encoding='utf-8') as f:
-                f.write('''import os
-import json
-from discord.ext import commands
+                f.write('''from discord.ext import commands
 
 class ExampleModule(commands.Cog, name="Example Module"):
-    """Пример пользовательского модуля, читающего свои переменные из variables.json"""
+    """Пример пользовательского модуля со своими переменными (раздел modules.example в variables.json)"""
     def __init__(self, bot):
         self.bot = bot
-        vars_path = os.path.join(os.path.dirname(__file__), 'variables.json')
-        with open(vars_path, 'r', encoding='utf-8') as vf:
-            cfg = json.load(vf)
-        # Merge into bot settings
-        if hasattr(self.bot, 'settings'):
-            self.bot.settings.update(cfg)
-        else:
-            self.bot.settings = cfg
+        # Свой раздел конфигурации со значениями по умолчанию; читается актуальный снимок
+        self.vars = self.bot.config.namespace('example', defaults={'custom_var': 'value', 'another_var': 123})
 
     @commands.command(name='showcustom')
     async def show_custom(self, ctx):
-        cv = self.bot.settings.get('custom_var')
-        av = self.bot.settings.get('another_var')
+        cv = self.vars.get('custom_var')
+        av = self.vars.get('another_var')
         await ctx.send(f'Custom Var: {cv}, Another Var: {av}')
 
 async def setup(bot):
     await bot.add_cog(ExampleModule(bot))\n''')
-        # Load cogs
-        cogs_dir = os.path.join(base_dir, 'cogs')
-        logger.info(f"Loading cogs from {cogs_dir}...")
-        for fn in os.listdir(cogs_dir):
-            if fn.endswith('.py') and fn != '__init__.py':
-                mod = fn[:-3]
-                try:
-                    await self.load_extension(f'cogs.{mod}')
-                    logger.info(f'Loaded cog: {mod}')
-                except Exception as e:
-                    logger.error(f'Failed to load cog {mod}: {e}')
-        # Load user modules
-        logger.info(f"Loading user modules from {modules_dir}...")
-        for fn in os.listdir(modules_dir):
-            if fn.endswith('.py') and fn != '__init__.py':
-                mod = fn[:-3]
-                try:
-                    await self.load_extension(f'modules.{mod}')
-                    logger.info(f'Loaded module: {mod}')
-                except Exception as e:
-                    logger.error(f'Failed to load module {mod}: {e}')
+        # Load cogs and user modules
+        logger.info(f"Loading extensions from {base_dir}/cogs and {modules_dir}...")
+        self.loader.discover('cogs', os.path.join(base_dir, 'cogs'))
+        self.loader.discover('modules', modules_dir)
+        await self.loader.load_all()
+        if self.config.get('settings', 'sync_commands', True, type=bool):
+            await self.sync_commands()
+        metrics_port = self.config.get('settings', 'metrics_port', 0, type=int)
+        if metrics_port:
+            host = self.config.get('settings', 'metrics_host', '127.0.0.1')
+            await self.metrics.serve(host, metrics_port)
+        hot_reload = self.config.get('settings', 'hot_reload_interval', 0, type=float)
+        if hot_reload:
+            self.reloader.start_watching(hot_reload)
 
 bot = ModularBot()
 
@@ -95,6 +243,12 @@ bot = ModularBot()
 async def on_ready():
     logger.info(f'Bot logged in as {bot.user} (ID: {bot.user.id})')
     print('------')
+    # on_ready приходит и после переподключений; повтор отправки нужен только при запуске
+    await bot.lifecycle.once('outbox', bot.replay_outbox)
+
+@bot.event
+async def on_socket_event_type(event):
+    bot.metrics.event(event)
 
 @bot.event
 async def on_message(message):
@@ -104,9 +258,19 @@ async def on_message(message):
 
 @bot.event
 async def on_command_error(ctx, error):
-    if isinstance(error, commands.CommandNotFound): return
+    if isinstance(error, commands.CommandNotFound):
+        # Команда может принадлежать отложенному (lazy) модулю
+        if await bot.loader.load_lazy():
+            await bot.process_commands(ctx.message)
+        return
+    if ctx.command is not None:
+        bot.metrics.error('command', ctx.cog.qualified_name if ctx.cog else 'bot', ctx.command.qualified_name)
     logger.error(f"Error in command {ctx.command}: {error}")
     await ctx.send(f':warning: Произошла ошибка: `{error}`')
 
 if __name__ == '__main__':
-    bot.run(BOT_TOKEN)
\ No newline at end of file
+    processes = settings.get('processes', 1)
+    if processes > 1 and SHARD_IDS is None:
+        launch(os.path.abspath(__file__), SHARD_COUNT or processes, processes)
+    else:
+        bot.lifecycle.run(BOT_TOKEN)
\ No newline at end of file
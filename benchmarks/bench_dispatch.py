@@ -0,0 +1,121 @@
+"""Стоимость диспетчеризации MESSAGE_CREATE с маршрутизацией событий и без неё.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.bench_dispatch --messages 20000
+
+Сравнивает прежний глобальный слушатель on_message мастера настройки,
+маршрут EventRouter при неактивном мастере (слушатель не зарегистрирован)
+и при активном (сообщения из чужих каналов отсекаются фильтром).
+"""
+import argparse
+import asyncio
+import time
+
+import discord
+from discord.ext import commands
+
+from benchmarks.fakes import FakeBot, FakeChannel, FakeGuild, FakeMember
+from core.events import EventRouter
+from core.guilds import GuildConfig
+from modules.vacation_request import VacationRequestModule, WizardState
+
+
+class FakeAuthor(FakeMember):
+    bot = False
+
+
+class FakeTextMessage:
+    __slots__ = ('author', 'channel', 'guild', 'content')
+
+    def __init__(self, author, channel, guild, content):
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.content = content
+
+
+class BenchBot(commands.Bot):
+    async def on_message(self, message):
+        # Префиксные команды в бенчмарке не участвуют: меряем только слушатели cog'ов
+        pass
+
+
+async def build_bot():
+    bot = BenchBot(command_prefix='!', intents=discord.Intents.default())
+    fake = FakeBot({'mention_map': {}})
+    bot.store, bot.config, bot.pipeline = fake.store, fake.config, fake.pipeline
+    bot.settings = {'config_channel_id': 1}
+    bot.router = EventRouter(bot)
+    bot.guild_config = GuildConfig(bot)
+    cog = VacationRequestModule(bot)
+    await bot.add_cog(cog)
+    return bot, cog, fake
+
+
+def legacy_listener(cog):
+    """Тело прежнего VacationRequestModule.on_message до раннего выхода"""
+    async def on_message(message):
+        if message.author.bot:
+            return
+        cfg_ch = cog.bot.settings.get('config_channel_id')
+        if message.channel.id != cfg_ch or not cog._wizards:
+            return
+    return on_message
+
+
+async def run(bot, messages):
+    started = time.perf_counter()
+    for msg in messages:
+        bot.dispatch('message', msg)
+    current = asyncio.current_task()
+    await asyncio.gather(*(t for t in asyncio.all_tasks() if t is not current))
+    return (time.perf_counter() - started) / len(messages)
+
+
+async def main(args):
+    bot, cog, fake = await build_bot()
+    async with bot:
+        await measure(args, bot, cog)
+    await fake.close()
+
+
+async def measure(args, bot, cog):
+    guild = FakeGuild(['@everyone'])
+    bot.guild_config.set(guild, 'config_channel_id', 1)
+    author = FakeAuthor(guild.roles)
+    channels = [FakeChannel() for _ in range(20)]
+    messages = [FakeTextMessage(author, channels[i % len(channels)], guild, 'hello') for i in range(args.messages)]
+    await run(bot, messages[:1000])  # прогрев
+
+    cog._wizards = {}
+    bot.router.refresh()
+    routed_idle = await run(bot, messages)
+
+    state = WizardState(['request_channel_id'])
+    state.asking = True
+    cog._wizards = {guild.id: state}
+    bot.router.refresh()
+    routed_active = await run(bot, messages)
+    cog._wizards = {}
+    bot.router.refresh()
+
+    legacy = legacy_listener(cog)
+    bot.add_listener(legacy, 'on_message')
+    baseline = await run(bot, messages)
+    bot.remove_listener(legacy, 'on_message')
+
+    print(f"{'scenario':<34}{'µs/event':>10}")
+    print(f"{'global on_message listener':<34}{baseline * 1e6:>10.2f}")
+    print(f"{'router, wizard active':<34}{routed_active * 1e6:>10.2f}")
+    print(f"{'router, wizard idle':<34}{routed_idle * 1e6:>10.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
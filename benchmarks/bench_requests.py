@@ -0,0 +1,167 @@
+"""Нагрузочный бенчмарк потока заявок без живой гильдии.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.bench_requests --roles 600 --mapped 50 --users 200
+
+Гоняет настоящие обработчики VacationModal, BreakModal, ApprovalView и
+MentionAddModal на поддельных объектах Discord и печатает p50/p99 задержки
+обработчика, память на одну заявку и пропускную способность.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fakes import FakeBot, FakeGuild, FakeInteraction, FakeMember
+from modules.vacation_request import (
+    BreakModal, MentionAddModal, VacationModal, VacationRequestModule
+)
+
+
+def build_world(args):
+    names = [f'role-{i}' for i in range(args.roles)]
+    guild = FakeGuild(names)
+    rnd = random.Random(args.seed)
+    sources = rnd.sample(names, args.mapped)
+    mapping = {src: rnd.sample(names, args.targets) for src in sources}
+    bot = FakeBot({'mention_map': mapping}, latency=args.latency / 1000)
+    bot.add_guild(guild)
+    cog = VacationRequestModule(bot)
+    members = []
+    for _ in range(args.users):
+        roles = rnd.sample(guild.roles, args.user_roles - 1) + [guild.role(rnd.choice(sources))]
+        members.append(FakeMember(roles))
+    return bot, cog, guild, members
+
+
+def vacation_modal(cog):
+    modal = VacationModal(cog, 'icc_vacation_channel_id', 'ICC Отпуск')
+    modal.start_date._value = '01.07.2026'
+    modal.end_date._value = '14.07.2026'
+    modal.reason._value = 'bench'
+    return modal
+
+
+def break_modal(cog):
+    modal = BreakModal(cog, 'break_channel_id', 'Перерыв')
+    modal.start_time._value = '12:00'
+    modal.end_time._value = '12:15'
+    modal.reason._value = ''
+    return modal
+
+
+async def timed(samples, coro):
+    started = time.perf_counter()
+    await coro
+    samples.append(time.perf_counter() - started)
+
+
+async def drain(bot):
+    while any(st['depth'] for st in bot.pipeline.stats().values()) or any(
+            cq.worker and not cq.worker.done() for cq in bot.pipeline._channels.values()):
+        await asyncio.sleep(0.001)
+
+
+def report(name, samples):
+    ms = sorted(s * 1000 for s in samples)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    print(f'{name:<22}{len(ms):>8}{statistics.median(ms):>11.3f}{p99:>11.3f}')
+
+
+async def bench_handlers(args, bot, cog, guild, members):
+    print(f"{'handler':<22}{'calls':>8}{'p50 ms':>11}{'p99 ms':>11}")
+    for name, factory in (('VacationModal', vacation_modal), ('BreakModal', break_modal)):
+        samples = []
+        for i in range(args.iterations):
+            user = members[i % len(members)]
+            await timed(samples, factory(cog).on_submit(FakeInteraction(user, guild)))
+        await drain(bot)
+        report(name, samples)
+
+    # Одобрение: каждую опубликованную заявку принимает пользователь с разрешённой ролью
+    samples = []
+    messages = [m for ch in bot.channels.values() for m in ch.sent if m.view is not None]
+    for msg in messages[:args.iterations]:
+        button = msg.view.children[0]
+        rid = int(button.custom_id.split(':')[1])
+        allowed = set(json.loads(bot.store.get(rid)['allowed']))
+        approver = next((m for m in members if any(r.id in allowed for r in m.roles)), None)
+        if approver is None:
+            continue
+        await timed(samples, button.callback(FakeInteraction(approver, guild, msg)))
+    if samples:
+        report('ApprovalView.approve', samples)
+
+    samples = []
+    for i in range(args.iterations):
+        modal = MentionAddModal(cog)
+        modal.role_name._value = guild.roles[i % len(guild.roles)].name
+        modal.targets._value = ', '.join(r.name for r in guild.roles[i % 7:i % 7 + args.targets])
+        await timed(samples, modal.on_submit(FakeInteraction(members[0], guild)))
+    report('MentionAddModal', samples)
+
+
+async def bench_allocations(args, cog, guild, members):
+    tracemalloc.start()
+    peaks, blocks = [], []
+    for i in range(min(args.iterations, 200)):
+        modal = vacation_modal(cog)
+        interaction = FakeInteraction(members[i % len(members)], guild)
+        before_blocks = sys.getallocatedblocks()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await modal.on_submit(interaction)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        blocks.append(sys.getallocatedblocks() - before_blocks)
+    tracemalloc.stop()
+    print(f'\nallocations per VacationModal submission: peak {statistics.median(peaks) / 1024:.1f} KiB, '
+          f'net {statistics.median(blocks):.0f} blocks')
+
+
+async def bench_throughput(args, bot, cog, guild, members):
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        (vacation_modal if i % 2 else break_modal)(cog).on_submit(FakeInteraction(user, guild))
+        for i, user in enumerate(members)
+    ))
+    accepted = time.perf_counter() - started
+    await drain(bot)
+    total = time.perf_counter() - started
+    print(f'\n{len(members)} concurrent users: accepted in {accepted * 1000:.1f} ms, '
+          f'all sent in {total * 1000:.1f} ms ({len(members) / total:.0f} submissions/s)')
+    for channel_id, st in bot.pipeline.stats().items():
+        print(f"  channel {channel_id}: sent {st['sent']}, p50 {st['p50'] * 1000:.1f} ms, p99 {st['p99'] * 1000:.1f} ms")
+
+
+async def main(args):
+    bot, cog, guild, members = build_world(args)
+    print(f'guild roles {args.roles}, mapped sources {args.mapped} x {args.targets} targets, '
+          f'user roles {args.user_roles}, users {args.users}\n')
+    try:
+        await bench_handlers(args, bot, cog, guild, members)
+        await bench_allocations(args, cog, guild, members)
+        await bench_throughput(args, bot, cog, guild, members)
+    finally:
+        await bot.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--roles', type=int, default=600, help='ролей в гильдии')
+    parser.add_argument('--mapped', type=int, default=50, help='ролей-источников в mention_map')
+    parser.add_argument('--targets', type=int, default=3, help='упоминаемых ролей на источник')
+    parser.add_argument('--user-roles', type=int, default=10, help='ролей у пользователя')
+    parser.add_argument('--users', type=int, default=200, help='одновременных пользователей')
+    parser.add_argument('--iterations', type=int, default=1000, help='вызовов каждого обработчика')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка API Discord, мс')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,71 @@
+"""Стоимость таймеров заявок: массовая загрузка, срабатывание и отмена.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.bench_scheduler --timers 100000
+
+Загружает таймеры одной перестройкой кучи (как при восстановлении после
+перезапуска), затем по одному, снимает половину и дожидается срабатывания
+ближайших: на цикле событий всегда висит только один ``call_at``.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from core.scheduler import Scheduler
+
+
+async def main(args):
+    fired = 0
+    done = asyncio.Event()
+
+    async def callback(key):
+        nonlocal fired
+        fired += 1
+        if fired == args.due:
+            done.set()
+
+    now = time.time()
+    # Большинство сроков далеко в будущем (как у отпусков), args.due истекают сразу
+    timers = [(now + random.uniform(3600, 30 * 86400), i, callback, (i,)) for i in range(args.timers)]
+    timers += [(now + random.uniform(0, 0.05), -i - 1, callback, (i,)) for i in range(args.due)]
+
+    bulk = Scheduler()
+    started = time.perf_counter()
+    bulk.load(timers)
+    bulk_time = time.perf_counter() - started
+
+    single = Scheduler()
+    started = time.perf_counter()
+    for when, key, cb, cb_args in timers:
+        single.schedule(when, key, cb, *cb_args)
+    single_time = time.perf_counter() - started
+    single.stop()
+
+    started = time.perf_counter()
+    for key in range(0, args.timers, 2):
+        bulk.cancel(key)
+    cancel_time = time.perf_counter() - started
+
+    await asyncio.wait_for(done.wait(), 5)
+    pending = len(bulk)
+    bulk.stop()
+
+    total = len(timers)
+    print(f"{'operation':<30}{'total ms':>10}{'µs/timer':>10}")
+    print(f"{'bulk load':<30}{bulk_time * 1e3:>10.1f}{bulk_time / total * 1e6:>10.2f}")
+    print(f"{'schedule one by one':<30}{single_time * 1e3:>10.1f}{single_time / total * 1e6:>10.2f}")
+    print(f"{'cancel half':<30}{cancel_time * 1e3:>10.1f}{cancel_time / (args.timers // 2) * 1e6:>10.2f}")
+    print(f'fired {fired}, still pending {pending}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--timers', type=int, default=100000)
+    parser.add_argument('--due', type=int, default=1000)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,114 @@
+"""Проверка режима кластера на поддельном шлюзе.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.cluster_check --shards 8 --processes 3 --guilds 200
+
+Поддельный шлюз раздаёт события гильдий по формуле Discord
+``(guild_id >> 22) % shard_count``. Каждый процесс-воркер обрабатывает
+только свои шарды, пишет заявки и конфигурацию в общую базу и затем
+проверяет, что видит изменения остальных процессов (их подхватывает
+собственный опрос ConfigService, без ручного ``refresh``).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from core.cluster import assign_shards, shard_for_guild
+from core.config import ConfigService
+from core.store import RequestStore
+
+
+def fake_gateway(guild_ids, shard_count, shard_ids, events_per_guild):
+    """События GUILD_CREATE/INTERACTION_CREATE только для гильдий своих шардов"""
+    for guild_id in guild_ids:
+        if shard_for_guild(guild_id, shard_count) in shard_ids:
+            yield 'GUILD_CREATE', guild_id
+            for _ in range(events_per_guild):
+                yield 'INTERACTION_CREATE', guild_id
+
+
+async def run_worker(index, tmp, guild_ids, shard_count, shard_ids, events_per_guild, processes):
+    store = RequestStore(os.path.join(tmp, 'requests.db'))
+    config = ConfigService(delay=0.01, store=store, poll=0.05)
+    config.register('settings', os.path.join(tmp, 'settings.json'))
+    seen = []
+    for event, guild_id in fake_gateway(guild_ids, shard_count, shard_ids, events_per_guild):
+        if event == 'GUILD_CREATE':
+            seen.append(guild_id)
+        else:
+            store.create(guild_id=guild_id, requester_id=index, kind='ICC Отпуск',
+                         start_ts=time.time(), end_ts=time.time() + 86400)
+    # Запись уходит в базу сама через ``delay``; flush_all остановил бы и опрос
+    config.set('settings', f'worker_{index}', len(seen))
+    # Ждём, пока в общей конфигурации появятся ключи всех воркеров
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if all(f'worker_{i}' in config.data('settings') for i in range(processes)):
+            break
+        await asyncio.sleep(0.05)
+    keys = sorted(k for k in config.data('settings') if k.startswith('worker_'))
+    await config.flush_all()
+    store.close()
+    return seen, keys
+
+
+def worker(index, tmp, guild_ids, shard_count, shard_ids, events_per_guild, processes, results):
+    results.put((index, asyncio.run(run_worker(
+        index, tmp, guild_ids, shard_count, shard_ids, events_per_guild, processes))))
+
+
+def main(args):
+    rnd = random.Random(args.seed)
+    guild_ids = [rnd.getrandbits(63) for _ in range(args.guilds)]
+    ranges = assign_shards(args.shards, args.processes)
+    print(f'shard ranges: {ranges}')
+    assert sorted(s for r in ranges for s in r) == list(range(args.shards)), 'shards not covered exactly once'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'settings.json'), 'w', encoding='utf-8') as f:
+            f.write('{"prefix": "!"}')
+        RequestStore(os.path.join(tmp, 'requests.db')).close()  # миграции до старта воркеров
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(
+            i, tmp, guild_ids, args.shards, shard_ids, args.events, len(ranges), results))
+            for i, shard_ids in enumerate(ranges)]
+        started = time.perf_counter()
+        for p in procs:
+            p.start()
+        outcome = dict(results.get(timeout=60) for _ in procs)
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - started
+
+        handled = [g for seen, _ in outcome.values() for g in seen]
+        assert sorted(handled) == sorted(guild_ids), 'every guild must be handled by exactly one worker'
+        expected_keys = [f'worker_{i}' for i in range(len(ranges))]
+        for index, (seen, keys) in sorted(outcome.items()):
+            print(f'worker {index}: shards {ranges[index]}, guilds {len(seen)}, sees config keys {keys}')
+            assert keys == expected_keys, f'worker {index} has a stale config view'
+        store = RequestStore(os.path.join(tmp, 'requests.db'))
+        total = store.db.execute('SELECT COUNT(*) FROM requests').fetchone()[0]
+        per_guild = store.db.execute(
+            'SELECT COUNT(DISTINCT guild_id), COUNT(DISTINCT requester_id) FROM requests').fetchone()
+        store.close()
+        assert total == args.guilds * args.events, f'lost requests: {total}'
+        print(f'{total} requests from {per_guild[1]} workers over {per_guild[0]} guilds in {elapsed:.2f}s — OK')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=3)
+    parser.add_argument('--guilds', type=int, default=200)
+    parser.add_argument('--events', type=int, default=5, help='заявок на гильдию')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,176 @@
+"""Подделки объектов Discord, которых касаются обработчики модуля заявок.
+
+Реализованы только атрибуты и методы, реально используемые модалами и
+view; сетевые вызовы заменены задержкой ``latency``.
+"""
+import asyncio
+import itertools
+import os
+import tempfile
+
+from core.config import ConfigService
+from core.events import EventRouter
+from core.guilds import GuildConfig
+from core.pipeline import SendPipeline
+from core.store import RequestStore
+
+_ids = itertools.count(10_000)
+
+
+class FakeRole:
+    __slots__ = ('id', 'name', 'guild')
+
+    def __init__(self, name, guild):
+        self.id = next(_ids)
+        self.name = name
+        self.guild = guild
+
+    @property
+    def mention(self):
+        return f'<@&{self.id}>'
+
+
+class FakeGuild:
+    def __init__(self, role_names):
+        self.id = next(_ids)
+        self.roles = [FakeRole(n, self) for n in role_names]
+        # Участники не кэшированы, как без intent'а members
+        self.chunked = False
+
+    def role(self, name):
+        return next(r for r in self.roles if r.name == name)
+
+
+class FakeMember:
+    def __init__(self, roles):
+        self.id = next(_ids)
+        self.roles = roles
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embeds=(), view=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embeds = list(embeds)
+        self.view = view
+
+    async def edit(self, *, embeds=None, embed=None, view=None, **kwargs):
+        await asyncio.sleep(self.channel.latency)
+        if embed is not None:
+            embeds = [embed]
+        if embeds is not None:
+            self.embeds = list(embeds)
+        self.view = view
+        return self
+
+
+class FakeChannel:
+    def __init__(self, latency=0.0):
+        self.id = next(_ids)
+        self.latency = latency
+        self.guild = None
+        self.sent = []
+        self.messages = {}
+
+    async def send(self, content=None, *, embed=None, embeds=None, view=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        msg = FakeMessage(self, content, [embed] if embed is not None else embeds or (), view)
+        self.sent.append(msg)
+        self.messages[msg.id] = msg
+        return msg
+
+    def get_partial_message(self, message_id):
+        return self.messages[message_id]
+
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+        self.modal = None
+        self.messages = []
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self.messages.append(content)
+
+    async def send_modal(self, modal):
+        self.done = True
+        self.modal = modal
+
+
+class FakeFollowup:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content)
+
+
+class FakeInteraction:
+    def __init__(self, user, guild, message=None):
+        self.user = user
+        self.guild = guild
+        self.message = message
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+class FakeBot:
+    """Минимальный бот: настоящие хранилище, конфиг и очередь, поддельные каналы.
+
+    ``variables`` — настройки гильдии (карта упоминаний); каналы заявок бот создаёт
+    сам, а ``add_guild`` записывает всё это в секцию гильдии.
+    """
+    def __init__(self, variables, latency=0.0):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.channels = {}
+        self.variables = dict(variables)
+        for key in ('request_channel_id', 'icc_vacation_channel_id', 'oc_vacation_channel_id', 'break_channel_id'):
+            ch = FakeChannel(latency)
+            self.channels[ch.id] = ch
+            self.variables[key] = ch.id
+        self.settings = {'config_channel_id': 1}
+        self.store = RequestStore(os.path.join(self.tmp.name, 'requests.db'))
+        self.config = ConfigService()
+        self.config.register('settings', os.path.join(self.tmp.name, 'settings.json'), default=self.settings)
+        self.config.register('variables', os.path.join(self.tmp.name, 'variables.json'), default={})
+        self.guild_config = GuildConfig(self)
+        self.pipeline = SendPipeline(queue_size=100_000, rate=1e9, burst=1e9)
+        self.router = EventRouter(self)
+        self.views = []
+        self.listeners = {}
+
+    def add_guild(self, guild):
+        # Каналы заявок принадлежат этой гильдии — бот проверяет это перед публикацией
+        for channel in self.channels.values():
+            channel.guild = guild
+        self.guild_config.update(guild, self.variables)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def add_view(self, view, message_id=None):
+        self.views.append((view, message_id))
+
+    def add_listener(self, func, name):
+        self.listeners.setdefault(name, []).append(func)
+
+    def remove_listener(self, func, name):
+        self.listeners.get(name, []).remove(func)
+
+    async def close(self):
+        await self.config.flush_all()
+        self.pipeline.stop()
+        self.store.close()
+        self.tmp.cleanup()
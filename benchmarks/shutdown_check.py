@@ -0,0 +1,110 @@
+"""Проверка остановки под нагрузкой: ни одна заявка не теряется и не дублируется.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.shutdown_check --requests 200 --deadline 0.3
+
+Подаёт заявки на перерыв в медленный канал, останавливает очередь с коротким
+сроком (как ModularBot.close по SIGTERM), сохраняет неотправленное в outbox,
+затем «перезапускает» модуль на новой очереди и повторяет отправку. В конце
+у каждой заявки должно быть ровно одно опубликованное сообщение.
+
+Затем одобряет заявки и останавливается, не дав правкам сообщений уйти:
+после перезапуска у каждого одобренного сообщения не должно остаться кнопок.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fakes import FakeBot, FakeGuild, FakeInteraction, FakeMember
+from core.pipeline import SendPipeline
+from modules.vacation_request import BreakModal, VacationRequestModule
+
+
+def break_modal(cog):
+    modal = BreakModal(cog, 'break_channel_id', 'Перерыв')
+    modal.start_time._value = '12:00'
+    modal.end_time._value = '12:15'
+    modal.reason._value = ''
+    return modal
+
+
+async def start(bot):
+    cog = VacationRequestModule(bot)
+    await cog.cog_load()
+    return cog
+
+
+async def stop(bot, cog, deadline):
+    """Остановка как в ModularBot.close: дренаж очереди и сохранение неотправленного"""
+    await bot.pipeline.drain(deadline)
+    unsent = bot.pipeline.unsent()
+    bot.store.outbox_add([job.to_record() for job in unsent])
+    cog.timers.stop()
+    return unsent
+
+
+async def restart(bot):
+    """Новая очередь и новый экземпляр модуля, затем повтор из outbox"""
+    bot.pipeline = SendPipeline(queue_size=100_000, rate=1e9, burst=1e9)
+    cog = await start(bot)
+    done = bot.pipeline.replay(bot.store.outbox(), bot.get_channel)
+    bot.store.outbox_delete(done)
+    workers = [cq.worker for cq in bot.pipeline._channels.values() if cq.worker is not None]
+    await asyncio.gather(*workers)
+    return cog, done
+
+
+async def main(args):
+    bot = FakeBot({'mention_map': {'staff': ['staff']}}, latency=args.latency / 1000)
+    guild = FakeGuild(['staff'])
+    bot.add_guild(guild)
+    user = FakeMember(guild.roles)
+    cog = await start(bot)
+    for _ in range(args.requests):
+        await break_modal(cog).on_submit(FakeInteraction(user, guild))
+
+    started = time.perf_counter()
+    unsent = await stop(bot, cog, args.deadline)
+    stopped = time.perf_counter() - started
+    cog, done = await restart(bot)
+
+    channel = bot.get_channel(bot.guild_config.get(guild, 'break_channel_id'))
+    published = bot.store.db.execute(
+        "SELECT COUNT(*) FROM requests WHERE message_id IS NOT NULL").fetchone()[0]
+    print(f'submitted {args.requests}, stopped in {stopped * 1000:.0f} ms with {len(unsent)} unsent, '
+          f'replayed {len(done)}')
+    print(f'messages sent {len(channel.sent)}, requests published {published}, '
+          f'outbox left {len(bot.store.outbox())}')
+    ok = len(channel.sent) == published == args.requests
+
+    # Решения: остановка приходит, пока обработчики кнопок ещё работают; решение
+    # уже в базе, а правка сообщения должна уйти в outbox, а не потеряться
+    handlers = [asyncio.ensure_future(msg.view.children[0].callback(FakeInteraction(user, guild, msg)))
+                for msg in channel.sent]
+    await asyncio.sleep(0)
+    edits = await stop(bot, cog, 0)
+    for task in handlers:
+        task.cancel()
+    await asyncio.gather(*handlers, return_exceptions=True)
+    cog, _ = await restart(bot)
+    cog.timers.stop()
+    approved = bot.store.db.execute("SELECT COUNT(*) FROM requests WHERE status = 'approved'").fetchone()[0]
+    closed = sum(1 for msg in channel.sent if msg.view is None)
+    print(f'approved {approved}, {len(edits)} edits saved at stop, messages without buttons {closed}')
+    ok = ok and approved == closed == args.requests
+    print('OK' if ok else 'MISMATCH')
+    await bot.close()
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=10.0, help='задержка отправки, мс')
+    parser.add_argument('--deadline', type=float, default=0.3, help='срок дренажа очереди, с')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if asyncio.run(main(parse_args())) else 1)
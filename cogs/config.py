@@ -1,32 +1,60 @@
 from discord.ext import commands
 import json
-import os
+
+# Необязательные ключи settings.json: значение по умолчанию и описание.
+# В файле их нет, пока их не зададут, поэтому !set принимает и их.
+# (*) — читается при запуске, действует после перезапуска бота
+TUNABLES = {
+    'request_remind_hours': (0, 'напомнить о нерассмотренной заявке через N часов (0 — выключено)'),
+    'request_expire_hours': (0, 'закрыть нерассмотренную заявку через N часов (0 — выключено)'),
+    'break_digest_window': (0, 'собирать заявки на перерыв за N секунд в одно сообщение (0 — выключено) (*)'),
+    'shutdown_timeout': (10, 'сколько секунд остановка ждёт отправки очереди'),
+    'sync_commands': (True, 'синхронизировать slash-команды при запуске и перезагрузке'),
+    'send_queue_size': (100, 'размер очереди исходящих сообщений (*)'),
+    'send_rate': (1.0, 'сообщений в секунду на канал (*)'),
+    'send_burst': (5, 'сколько сообщений подряд можно отправить в канал без паузы (*)'),
+    'config_watch_interval': (0, 'период проверки правок файлов конфигурации, с (0 — выключено; в кластере 1) (*)'),
+    'hot_reload_interval': (0, 'период проверки изменённых расширений, с (0 — выключено) (*)'),
+    'metrics_port': (0, 'порт HTTP-метрик (0 — выключено) (*)'),
+    'metrics_host': ('127.0.0.1', 'адрес HTTP-метрик (*)'),
+    'memory_profile': ('default', 'профиль кэшей discord.py: default или low (*)'),
+    'max_messages': (1000, 'размер кэша сообщений (*)'),
+    'tracemalloc': (False, 'снимки памяти для !memstats с запуска (*)'),
+    'prefix_commands': (True, 'префиксные команды (нужен intent message_content) (*)'),
+    'shard_count': (None, 'число шардов (*)'),
+    'processes': (1, 'число процессов-воркеров кластера (*)'),
+}
 
 class Config(commands.Cog, name="Configuration"):
-    """Cog для просмотра и изменения настроек бота"""
+    """Cog для просмотра и изменения настроек бота (settings.json общий для всех серверов)"""
     def __init__(self, bot):
         self.bot = bot
-        path = os.path.join(os.path.dirname(__file__), '..', 'settings.json')
-        self.bot.settings = json.load(open(path, 'r', encoding='utf-8'))
 
-    @commands.command(name='showconfig')
-    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.settings.get('config_channel_id'))
+    @commands.hybrid_command(name='showconfig')
+    @commands.check(lambda ctx: ctx.bot.guild_config.is_bot_admin(ctx.author, ctx.channel))
     async def show_config(self, ctx):
-        data = json.load(open(path, 'r', encoding='utf-8'))
-        await ctx.send(f"```json\n{json.dumps(data, indent=2, ensure_ascii=False)}\n```")
+        """Показать settings.json"""
+        await ctx.send(await self.bot.config.render('settings'))
 
-    @commands.command(name='set')
-    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.settings.get('config_channel_id'))
+    @commands.hybrid_command(name='set')
+    @commands.check(lambda ctx: ctx.bot.guild_config.is_bot_admin(ctx.author, ctx.channel))
     async def set_config(self, ctx, key: str, *, value: str):
-        data = json.load(open(path, 'r', encoding='utf-8'))
-        if key not in data:
-            return await ctx.send(f':x: Unknown key `{key}`')
+        """Изменить ключ settings.json (значение в JSON или строкой)"""
+        if key not in self.bot.settings and key not in TUNABLES:
+            return await ctx.send(f':x: Unknown key `{key}`. Список ключей: `{ctx.clean_prefix}settings`')
         try: parsed = json.loads(value)
         except: parsed = value
-        data[key] = parsed
-        json.dump(data, open(path, 'w', encoding='utf-8'), indent=2, ensure_ascii=False)
-        self.bot.settings[key] = parsed
+        self.bot.config.set('settings', key, parsed)
         await ctx.send(f':white_check_mark: `{key}` = `{parsed}`')
 
+    @commands.hybrid_command(name='settings')
+    @commands.check(lambda ctx: ctx.bot.guild_config.is_bot_admin(ctx.author, ctx.channel))
+    async def show_tunables(self, ctx):
+        """Необязательные ключи settings.json: текущее значение, умолчание и описание"""
+        lines = [f'`{key}` = `{self.bot.settings.get(key, default)}` (по умолчанию `{default}`) — {text}'
+                 for key, (default, text) in TUNABLES.items()]
+        lines.append('(*) — после перезапуска бота')
+        await ctx.send('\n'.join(lines))
+
 async def setup(bot):
     await bot.add_cog(Config(bot))
@@ -1,19 +1,29 @@
+import os
+import sys
+import time
+import tracemalloc
 import discord
 from discord.ext import commands
 from discord.ui import View, Button
-import json
-import os
+from core.config import format_json
 
 class ControlPanel(commands.Cog, name="Control Panel"):
     """Панель управления ботом через интерактивный интерфейс Discord"""
     def __init__(self, bot):
         self.bot = bot
+        self.view = ControlPanelView(bot)
+
+    async def cog_load(self):
+        # Кнопки панели работают и на сообщениях, отправленных до перезапуска
+        self.bot.add_view(self.view)
 
-    @commands.command(name='panel')
-    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.settings.get('config_channel_id'))
+    def cog_unload(self):
+        self.view.stop()
+
+    @commands.hybrid_command(name='panel')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
     async def panel(self, ctx):
         """Открыть панель управления ботом"""
-        view = ControlPanelView(self.bot)
         # Получаем список человекочитаемых имён модулей
         names = []
         for key, cog in self.bot.cogs.items():
@@ -22,7 +32,101 @@ class ControlPanel(commands.Cog, name="Control Panel"):
             names.append(name)
         embed = discord.Embed(title='Control Panel', color=discord.Color.blurple())
         embed.add_field(name='Modules', value=', '.join(names) or 'None', inline=False)
-        await ctx.send(embed=embed, view=view)
+        await ctx.send(embed=embed, view=self.view)
+
+    @commands.hybrid_command(name='queue')
+    @commands.check(lambda ctx: ctx.bot.guild_config.is_bot_admin(ctx.author, ctx.channel))
+    async def queue(self, ctx):
+        """Состояние очереди исходящих сообщений"""
+        stats = self.bot.pipeline.stats()
+        embed = discord.Embed(title='Send queue', color=discord.Color.blurple())
+        for channel_id, st in stats.items():
+            embed.add_field(
+                name=str(channel_id),
+                value=(f"depth {st['depth']}, sent {st['sent']}, failed {st['failed']}\n"
+                       f"latency p50 {st['p50'] * 1000:.0f} ms, p99 {st['p99'] * 1000:.0f} ms"),
+                inline=False
+            )
+        if not stats:
+            embed.description = 'No messages sent yet.'
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name='stats')
+    @commands.check(lambda ctx: ctx.bot.guild_config.is_bot_admin(ctx.author, ctx.channel))
+    async def stats(self, ctx):
+        """Самые затратные обработчики и частота событий шлюза"""
+        m = self.bot.metrics
+        top = sorted(m.latency.items(), key=lambda kv: kv[1].total, reverse=True)[:10]
+        lines = []
+        for (kind, owner, key), hist in top:
+            lines.append(f"`{kind}` **{owner}** `{key}`: {hist.count} calls, "
+                         f"mean {hist.total / hist.count * 1000:.1f} ms, p99 ≤ {hist.quantile(0.99) * 1000:.0f} ms, "
+                         f"errors {m.errors.get((kind, owner, key), 0)}, in flight {m.in_flight.get((kind, owner, key), 0)}")
+        embed = discord.Embed(title='Stats', color=discord.Color.blurple())
+        embed.add_field(name='Handlers (by total time)', value='\n'.join(lines)[:1024] or 'No data', inline=False)
+        minutes = max((time.time() - m.started) / 60, 1 / 60)
+        events = sorted(m.events.items(), key=lambda kv: kv[1], reverse=True)[:10]
+        value = '\n'.join(f'`{e}`: {n / minutes:.1f}/min' for e, n in events)
+        embed.add_field(name='Gateway events', value=value or 'No data', inline=False)
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name='memstats')
+    @commands.check(lambda ctx: ctx.bot.guild_config.is_bot_admin(ctx.author, ctx.channel))
+    async def memstats(self, ctx):
+        """Память процесса, размеры кэшей и выделения по cog'ам (tracemalloc)"""
+        embed = discord.Embed(title='Memory', color=discord.Color.blurple())
+        rss = peak = None
+        try:
+            import resource
+        except ImportError:  # Windows: модуля нет, остаётся только tracemalloc
+            pass
+        else:
+            # ru_maxrss в КиБ на Linux и в байтах на macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 1024)
+        try:
+            with open('/proc/self/statm') as f:
+                rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+        except OSError:
+            pass
+        parts = [f'{rss:.1f} MiB' if rss is not None else None, f'peak {peak:.1f} MiB' if peak is not None else None]
+        embed.add_field(name='RSS', value=' / '.join(p for p in parts if p) or 'n/a', inline=False)
+        members = sum(len(g.members) for g in self.bot.guilds)
+        embed.add_field(
+            name='Caches',
+            value=f'guilds {len(self.bot.guilds)}, users {len(self.bot.users)}, members {members}, '
+                  f'messages {len(self.bot.cached_messages)}',
+            inline=False
+        )
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            embed.add_field(name='Allocations', value='tracemalloc запущен — повторите команду позже', inline=False)
+            return await ctx.send(embed=embed)
+        # Соотносим файлы с cog'ами по модулю, в котором объявлен класс cog'а
+        owners = {}
+        for name, cog in self.bot.cogs.items():
+            module = sys.modules.get(type(cog).__module__)
+            if module is not None and getattr(module, '__file__', None):
+                owners[os.path.abspath(module.__file__)] = name
+        core_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core')
+        discord_dir = os.path.dirname(os.path.abspath(discord.__file__))
+        totals = {}
+        snapshot = tracemalloc.take_snapshot()
+        for stat in snapshot.statistics('filename'):
+            path = os.path.abspath(stat.traceback[0].filename)
+            if path in owners:
+                owner = owners[path]
+            elif path.startswith(core_dir):
+                owner = 'core'
+            elif path.startswith(discord_dir):
+                owner = 'discord.py'
+            else:
+                owner = 'other'
+            size, count = totals.get(owner, (0, 0))
+            totals[owner] = (size + stat.size, count + stat.count)
+        lines = [f'**{owner}**: {size / 1024:.0f} KiB in {count} blocks'
+                 for owner, (size, count) in sorted(totals.items(), key=lambda kv: -kv[1][0])]
+        embed.add_field(name='Allocations (live, by file owner)', value='\n'.join(lines)[:1024], inline=False)
+        await ctx.send(embed=embed)
 
 async def setup(bot):
     await bot.add_cog(ControlPanel(bot))
@@ -32,30 +136,48 @@ class ControlPanelView(View):
         super().__init__(timeout=None)
         self.bot = bot
 
+    async def interaction_check(self, interaction: discord.Interaction):
+        # Панель постоянная: кнопки доступны там же, где команда !panel, — в канале конфигурации
+        guilds = self.bot.guild_config
+        if interaction.guild is not None and interaction.channel.id == guilds.get(interaction.guild, 'config_channel_id'):
+            return True
+        if await guilds.is_bot_admin(interaction.user, interaction.channel):
+            return True
+        await interaction.response.send_message(':x: Нет прав', ephemeral=True)
+        return False
+
     @discord.ui.button(label='Show Settings', style=discord.ButtonStyle.primary, custom_id='control_show_settings')
     async def show_settings(self, interaction: discord.Interaction, button: Button):
-        """Показать файл переменных modules/variables.json"""
-        # Путь к файлу modules/variables.json
-        vars_path = os.path.join(os.path.dirname(__file__), '..', 'modules', 'variables.json')
-        try:
-            with open(vars_path, 'r', encoding='utf-8') as vf:
-                data = json.load(vf)
-        except FileNotFoundError:
-            await interaction.response.send_message(':x: Файл переменных не найден.', ephemeral=True)
-            return
-        formatted = json.dumps(data, indent=2, ensure_ascii=False)
-        await interaction.response.send_message(f"""```json
-{formatted}
-```""", ephemeral=True)
+        """Показать файл переменных modules/variables.json (администратору сервера — только свой раздел)"""
+        guilds = self.bot.guild_config
+        if await guilds.is_bot_admin(interaction.user, interaction.channel):
+            # Кэшированный блок пересобирается только при изменении файла
+            text = await self.bot.config.render('variables')
+        else:
+            text = format_json(self.bot.config.get(guilds.name, str(interaction.guild.id), {}))
+        await interaction.response.send_message(text, ephemeral=True)
 
     @discord.ui.button(label='Reload All', style=discord.ButtonStyle.secondary, custom_id='control_reload_all')
     async def reload_all(self, interaction: discord.Interaction, button: Button):
-        """Перезагрузить все модули"""
-        failed = []
-        for ext in list(self.bot.extensions.keys()):
-            try:
-                await self.bot.reload_extension(ext)
-            except Exception:
-                failed.append(ext)
-        msg = 'All modules reloaded successfully.' if not failed else f"Failed to reload: {', '.join(failed)}"
-        await interaction.response.send_message(msg, ephemeral=True)
\ No newline at end of file
+        """Перезагрузить изменённые модули и зависящие от них (для всех серверов — только администратору бота)"""
+        if not await self.bot.guild_config.is_bot_admin(interaction.user, interaction.channel):
+            return await interaction.response.send_message(':x: Перезагрузка модулей доступна только администратору бота',
+                                                           ephemeral=True)
+        # Отвечаем сразу, чтобы не упереться в 3-секундный лимит взаимодействия
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        results = await self.bot.reloader.reload_changed()
+        # Перезагруженные модули могли изменить набор slash-команд
+        if results and self.bot.config.get('settings', 'sync_commands', True, type=bool):
+            await self.bot.sync_commands()
+        failed = [r for r in results if r.error]
+        if not results:
+            embed = discord.Embed(title='Reload', description='No changes detected.', color=discord.Color.blurple())
+        else:
+            color = discord.Color.red() if failed else discord.Color.green()
+            embed = discord.Embed(title='Reload', color=color)
+            lines = [f"`{r.name}` {r.action} — {r.elapsed * 1000:.0f} ms" for r in results]
+            embed.add_field(name='Extensions', value='\n'.join(lines)[:1024], inline=False)
+            if failed:
+                errors = [f"`{r.name}`: {r.error}" for r in failed]
+                embed.add_field(name='Failed', value='\n'.join(errors)[:1024], inline=False)
+        await interaction.followup.send(embed=embed, ephemeral=True)
\ No newline at end of file
@@ -0,0 +1,75 @@
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger('discord')
+
+# Переменные окружения, которыми лаунчер передаёт воркеру его шарды
+ENV_SHARD_IDS = 'EMS_SHARD_IDS'
+ENV_SHARD_COUNT = 'EMS_SHARD_COUNT'
+
+
+def shard_for_guild(guild_id, shard_count):
+    """Номер шарда, через который Discord доставляет события гильдии"""
+    return (guild_id >> 22) % shard_count
+
+
+def assign_shards(shard_count, processes):
+    """Разбить шарды 0..shard_count-1 на непрерывные диапазоны по процессам"""
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    result, start = [], 0
+    for i in range(processes):
+        size = base + (i < extra)
+        result.append(list(range(start, start + size)))
+        start += size
+    return result
+
+
+def worker_shards():
+    """Шарды текущего процесса-воркера: (shard_ids, shard_count) или (None, None) вне кластера"""
+    ids = os.environ.get(ENV_SHARD_IDS)
+    if ids is None:
+        return None, None
+    return [int(i) for i in ids.split(',') if i], int(os.environ[ENV_SHARD_COUNT])
+
+
+def launch(script, shard_count, processes, restart_delay=5.0):
+    """Запустить по процессу бота на каждый диапазон шардов и перезапускать упавшие"""
+    ranges = assign_shards(shard_count, processes)
+    workers = {}
+    stopping = False
+
+    def start(i):
+        env = dict(os.environ)
+        env[ENV_SHARD_IDS] = ','.join(map(str, ranges[i]))
+        env[ENV_SHARD_COUNT] = str(shard_count)
+        workers[i] = subprocess.Popen([sys.executable, script], env=env)
+        logger.info(f'Started worker {i} (pid {workers[i].pid}) for shards {ranges[i]}')
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for proc in workers.values():
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for i in range(len(ranges)):
+        start(i)
+    while workers:
+        time.sleep(1)
+        for i, proc in list(workers.items()):
+            code = proc.poll()
+            if code is None:
+                continue
+            if stopping or code == 0:
+                del workers[i]
+            else:
+                logger.error(f'Worker {i} exited with {code}, restarting in {restart_delay}s')
+                time.sleep(restart_delay)
+                start(i)
@@ -0,0 +1,420 @@
+import asyncio
+import json
+import logging
+import os
+import stat
+import tempfile
+from types import MappingProxyType
+
+try:
+    from watchfiles import awatch
+except ImportError:  # необязательная зависимость: без неё остаётся опрос mtime
+    awatch = None
+
+logger = logging.getLogger('discord')
+
+# umask процесса читается один раз при импорте: os.umask меняет его для всех потоков
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Ключи, значения которых не показываются в отрендеренном конфиге
+REDACTED_KEYS = ('token', 'secret', 'password')
+
+
+def _file_id(path):
+    """Отпечаток файла для проверки изменений без чтения содержимого"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino, st.st_size
+
+
+def _redact(data):
+    if isinstance(data, dict):
+        return {k: '***' if any(r in k.lower() for r in REDACTED_KEYS) else _redact(v)
+                for k, v in data.items()}
+    if isinstance(data, list):
+        return [_redact(v) for v in data]
+    return data
+
+
+def format_json(data):
+    """Блок ```json``` для Discord с замаскированными секретами"""
+    formatted = json.dumps(_redact(data), indent=2, ensure_ascii=False)
+    return f"```json\n{formatted}\n```"
+
+
+def _nested(doc, path):
+    """Вложенный словарь по пути ключей (пустой, если пути нет)"""
+    for key in path:
+        doc = doc.get(key)
+        if not isinstance(doc, dict):
+            return {}
+    return doc
+
+
+def _with_nested(doc, path, value):
+    """Копия ``doc`` с подменённым вложенным значением; остальные ветви не копируются"""
+    inner = value
+    if len(path) > 1:
+        child = doc.get(path[0])
+        inner = _with_nested(child if isinstance(child, dict) else {}, path[1:], value)
+    return {**doc, path[0]: inner}
+
+
+def _atomic_write(path, text):
+    """Записать файл целиком через временный файл и os.replace (права файла сохраняются)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.tmp-', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp создаёт файл с 0600; новый файл получает права по umask, как при open()
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ConfigNamespace:
+    """Конфигурация модуля — раздел ``modules.<модуль>``: свой снимок, подписчики и запись через сервис"""
+    __slots__ = ('service', 'name')
+
+    def __init__(self, service, name):
+        self.service = service
+        self.name = name
+
+    @property
+    def snapshot(self):
+        return self.service.data(self.name)
+
+    def get(self, key, default=None, type=None):
+        return self.service.get(self.name, key, default, type)
+
+    def set(self, key, value):
+        self.service.set(self.name, key, value)
+
+    def update(self, values):
+        self.service.update(self.name, values)
+
+    def delete(self, keys):
+        self.service.delete(self.name, keys)
+
+    def add_listener(self, callback):
+        self.service.add_listener(self.name, callback)
+
+    def remove_listener(self, callback):
+        self.service.remove_listener(self.name, callback)
+
+
+class ConfigService:
+    """Общий слой конфигурации: снимки в памяти, отложенная атомарная запись на диск.
+
+    Каждый JSON-файл регистрируется под именем документа. Документ доступен
+    только как неизменяемый снимок: ``set``/``update``/``reload`` собирают
+    новый словарь и подменяют снимок целиком (copy-on-write), поэтому
+    читатели не копируют и не блокируют, а подписчики получают новый снимок.
+    Запись на диск объединяется в окне ``delay`` секунд и выполняется в пуле
+    потоков. Внешние правки файлов подхватываются по изменению mtime/inode.
+
+    С ``store`` (режим нескольких процессов) источником истины становится
+    таблица ``config`` хранилища: JSON-файл только засевает её при первом
+    запуске, записываются лишь изменённые ключи, а правки других процессов
+    подхватываются опросом версии документа каждые ``poll`` секунд (опрос
+    запускается сам при регистрации первого документа).
+
+    Раздел (``section``) — вложенный словарь документа, опубликованный как
+    отдельный документ со своим снимком и подписчиками. В файле он остаётся
+    внутри родителя, а в общей базе хранится отдельно, по строке на ключ:
+    процессы, меняющие разные ключи раздела, не затирают друг друга.
+    Конфигурация модулей (``namespace``) — разделы ``modules.<модуль>``.
+    """
+    def __init__(self, delay=0.5, store=None, poll=1.0):
+        self.delay = delay
+        self.store = store
+        self.poll = poll
+        self._versions = {}
+        self._dirty = {}
+        self._docs = {}
+        self._snapshots = {}
+        self._paths = {}
+        self._pending = {}
+        self._locks = {}
+        self._file_ids = {}
+        self._rendered = {}
+        self._listeners = {}
+        self._sections = {}
+        self._namespaces = {}
+        self._watcher = None
+
+    def register(self, name, path, default=None):
+        """Зарегистрировать документ и прочитать его (вызывается при старте)"""
+        self._paths[name] = path
+        self._locks[name] = asyncio.Lock()
+        if not os.path.exists(path) and default is not None:
+            _atomic_write(path, json.dumps(default, indent=2, ensure_ascii=False))
+        with open(path, 'r', encoding='utf-8') as f:
+            doc = json.load(f)
+        self._file_ids[name] = _file_id(path)
+        if self.store is not None:
+            data, version = self.store.config_load(name)
+            if data is None:
+                values = {k: json.dumps(v, ensure_ascii=False) for k, v in doc.items()}
+                _, version = self.store.config_save(name, values)
+            else:
+                doc = data
+            self._versions[name] = version
+            # Без опроса правки других процессов (например, !set на другом воркере) не видны
+            self.start_watching(self.poll)
+        return self._publish(name, doc, notify=False)
+
+    def __contains__(self, name):
+        """Зарегистрирован ли документ (до setup_hook бота документов ещё нет)"""
+        return name in self._docs
+
+    def namespace(self, module, defaults=None, legacy=(), parent='variables'):
+        """Конфигурация модуля ``module`` (одна на модуль) в разделе ``modules.<module>`` документа ``parent``.
+
+        Ключи ``defaults`` и ``legacy``, которые раньше лежали на верхнем уровне
+        ``parent``, переносятся в раздел; недостающие ключи берутся из ``defaults``.
+        """
+        ns = self._namespaces.get(module)
+        if ns is not None:
+            return ns
+        name = self.section(parent, 'modules', module)
+        defaults = defaults or {}
+        top, current = self._docs[parent], self._docs[name]
+        keys = [k for k in (*defaults, *legacy) if k in top]
+        values = {k: top[k] for k in keys if k not in current}
+        values.update({k: v for k, v in defaults.items() if k not in current and k not in values})
+        if values:
+            self.update(name, values)
+        self.delete(parent, keys)
+        ns = self._namespaces[module] = ConfigNamespace(self, name)
+        return ns
+
+    def section(self, parent, *path):
+        """Зарегистрировать раздел документа ``parent`` по пути ключей ``path``;
+        возвращает имя документа раздела (``'.'.join(path)``)"""
+        name = '.'.join(path)
+        if name in self._sections:
+            return name
+        self._sections[name] = (parent, path)
+        self._locks[name] = asyncio.Lock()
+        data = dict(_nested(self._docs[parent], path))
+        if self.store is not None:
+            stored, version = self.store.config_load(name)
+            if stored is None:
+                # Первый запуск в кластере: раздел засевается из родителя
+                values = {k: json.dumps(v, ensure_ascii=False) for k, v in data.items()}
+                _, version = self.store.config_save(name, values)
+            else:
+                data = stored
+            self._versions[name] = version
+        self._publish(name, data, notify=False)
+        return name
+
+    def _publish(self, name, doc, notify=True):
+        # Опубликованный словарь больше не меняется: следующее изменение соберёт новый
+        sections = [(s, path) for s, (parent, path) in self._sections.items() if parent == name]
+        if self.store is not None:
+            # У разделов в базе свои строки: в снимок родителя подставляем их текущие данные
+            for section, path in sections:
+                doc = _with_nested(doc, path, self._docs[section])
+            sections = []
+        snapshot = self._set(name, doc, notify)
+        for section, path in sections:
+            # Файл перечитан: подписчики раздела узнают только об изменениях своего раздела
+            data = _nested(doc, path)
+            if data != self._docs[section]:
+                self._publish(section, dict(data), notify)
+        if name in self._sections:
+            parent, path = self._sections[name]
+            self._set(parent, _with_nested(self._docs[parent], path, doc), notify=False)
+        return snapshot
+
+    def _set(self, name, doc, notify):
+        self._docs[name] = doc
+        snapshot = self._snapshots[name] = MappingProxyType(doc)
+        self._rendered.pop(name, None)
+        if notify:
+            for callback in list(self._listeners.get(name, [])):
+                callback(snapshot)
+        return snapshot
+
+    def add_listener(self, name, callback):
+        """Вызывать ``callback(snapshot)`` после каждого изменения документа (в том числе извне)"""
+        self._listeners.setdefault(name, []).append(callback)
+
+    def remove_listener(self, name, callback):
+        if callback in self._listeners.get(name, []):
+            self._listeners[name].remove(callback)
+
+    def data(self, name):
+        """Текущий снимок документа только для чтения (вложенные значения тоже не изменяйте)"""
+        return self._snapshots[name]
+
+    def get(self, name, key, default=None, type=None):
+        """Получить значение; при указании ``type`` значение приводится к нему"""
+        value = self._docs[name].get(key, default)
+        if type is not None and value is not None and not isinstance(value, type):
+            try:
+                value = type(value)
+            except (TypeError, ValueError):
+                raise TypeError(f'{name}.{key}: expected {type.__name__}, got {value!r}') from None
+        return value
+
+    def set(self, name, key, value):
+        self.update(name, {key: value})
+
+    def update(self, name, values):
+        self._publish(name, {**self._docs[name], **values})
+        self.save(name, values.keys())
+
+    def delete(self, name, keys):
+        """Удалить ключи документа"""
+        keys = [k for k in keys if k in self._docs[name]]
+        if keys:
+            self._publish(name, {k: v for k, v in self._docs[name].items() if k not in keys})
+            self.save(name, keys)
+
+    def save(self, name, keys=None):
+        """Запланировать запись документа (или только ``keys``); вызовы в окне объединяются"""
+        if name in self._sections and self.store is None:
+            # В файле раздел записывается вместе с родителем
+            name, keys = self._sections[name][0], None
+        self._rendered.pop(name, None)
+        if keys is None:
+            self._dirty[name] = None
+        elif self._dirty.get(name, ()) is not None:
+            self._dirty[name] = self._dirty.get(name, set()) | set(keys)
+        if name in self._pending:
+            return
+        loop = asyncio.get_running_loop()
+        self._pending[name] = loop.call_later(self.delay, lambda: loop.create_task(self._flush(name)))
+
+    async def _flush(self, name):
+        self._pending.pop(name, None)
+        dirty = self._dirty.pop(name, None)
+        async with self._locks[name]:
+            if self.store is not None:
+                doc = self._docs[name]
+                keys = doc.keys() if dirty is None else [k for k in dirty if k in doc]
+                removed = [] if dirty is None else [k for k in dirty if k not in doc]
+                values = {k: json.dumps(doc[k], ensure_ascii=False) for k in keys}
+                try:
+                    previous, version = await asyncio.to_thread(
+                        self.store.config_save, name, values, dirty is None, removed)
+                except Exception as e:
+                    logger.error(f'Failed to write config {name}: {e}')
+                    return
+                # Собственная запись не должна считаться внешней правкой; если до неё документ
+                # менял другой процесс, версию не трогаем — опрос перечитает его целиком
+                if previous == self._versions.get(name):
+                    self._versions[name] = version
+                return
+            # Сериализуем в цикле событий, чтобы не читать словарь из другого потока
+            text = json.dumps(self._docs[name], indent=2, ensure_ascii=False)
+            try:
+                await asyncio.to_thread(_atomic_write, self._paths[name], text)
+            except OSError as e:
+                logger.error(f'Failed to write config {name}: {e}')
+            else:
+                # Собственная запись не должна считаться внешней правкой
+                self._file_ids[name] = _file_id(self._paths[name])
+
+    async def reload(self, name):
+        """Перечитать документ с диска (или из хранилища) и подменить снимок"""
+        def _read():
+            with open(self._paths[name], 'r', encoding='utf-8') as f:
+                return json.load(f)
+        if name in self._sections and self.store is None:
+            # Раздел перечитывается вместе с файлом родителя
+            await self.reload(self._sections[name][0])
+            return self._snapshots[name]
+        before = self._docs[name]
+        # Под замком записи: идущая запись сначала завершится, и прочитается уже она
+        async with self._locks[name]:
+            if self.store is not None:
+                data, version = await asyncio.to_thread(self.store.config_load, name)
+            else:
+                version = _file_id(self._paths[name])
+                data = await asyncio.to_thread(_read)
+        if self._docs[name] is not before or name in self._pending:
+            # Пока читали, документ изменили локально: прочитанное устарело и затёрло бы правку.
+            # Версию не обновляем — следующая проверка перечитает документ уже с ней
+            return self._snapshots[name]
+        if self.store is not None:
+            self._versions[name] = version
+        else:
+            self._file_ids[name] = version
+        return self._publish(name, data or {})
+
+    async def refresh(self, name):
+        """Перечитать документ, только если файл изменился извне; True при перечитывании"""
+        if name in self._pending:
+            # Несохранённые изменения в памяти важнее: они перезапишут файл
+            return False
+        if name in self._sections and self.store is None:
+            return await self.refresh(self._sections[name][0])
+        if self.store is not None:
+            if self.store.config_version(name) == self._versions.get(name):
+                return False
+        elif _file_id(self._paths[name]) == self._file_ids.get(name):
+            return False
+        try:
+            await self.reload(name)
+        except (OSError, ValueError) as e:
+            logger.error(f'Failed to reload config {name}: {e}')
+            return False
+        return True
+
+    async def render(self, name):
+        """Готовый блок ```json``` с замаскированными секретами, кэшируется до изменения"""
+        await self.refresh(name)
+        text = self._rendered.get(name)
+        if text is None:
+            text = self._rendered[name] = format_json(self._docs[name])
+        return text
+
+    def start_watching(self, interval=2.0):
+        """Следить за файлами: через watchfiles, если установлен, иначе опросом mtime"""
+        if self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch(interval))
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch(self, interval):
+        if awatch is not None and self.store is None:
+            paths = {os.path.abspath(p): n for n, p in self._paths.items()}
+            dirs = {os.path.dirname(p) for p in paths}
+            async for changes in awatch(*dirs, debounce=int(interval * 1000)):
+                for name in {paths[p] for _, p in changes if p in paths}:
+                    await self.refresh(name)
+        else:
+            while True:
+                await asyncio.sleep(interval)
+                for name in list(self._docs):
+                    try:
+                        await self.refresh(name)
+                    except Exception as e:
+                        # Занятая база или сбой чтения не должны останавливать опрос
+                        logger.error(f'Failed to check config {name}: {e}')
+
+    async def flush_all(self):
+        """Немедленно записать все отложенные изменения (при остановке бота)"""
+        self.stop_watching()
+        for name, handle in list(self._pending.items()):
+            handle.cancel()
+            await self._flush(name)
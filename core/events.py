@@ -0,0 +1,92 @@
+import logging
+
+logger = logging.getLogger('discord')
+
+
+def _ids(value):
+    return value() if callable(value) else value
+
+
+class Route:
+    __slots__ = ('event', 'handler', 'channels', 'guilds', 'check', 'when', 'active')
+
+    def __init__(self, event, handler, channels, guilds, check, when):
+        self.event = event
+        self.handler = handler
+        self.channels = channels
+        self.guilds = guilds
+        self.check = check
+        self.when = when
+        self.active = False
+
+    def matches(self, args):
+        obj = args[0] if args else None
+        if self.channels is not None:
+            channel = getattr(obj, 'channel', None)
+            if channel is None or channel.id not in _ids(self.channels):
+                return False
+        if self.guilds is not None:
+            guild = getattr(obj, 'guild', None)
+            if guild is None or guild.id not in _ids(self.guilds):
+                return False
+        return self.check is None or self.check(*args)
+
+
+class EventRouter:
+    """Подписки cog'ов на события шлюза с фильтрами по каналу, гильдии и состоянию.
+
+    Слушатель события регистрируется в боте, только пока есть хотя бы один
+    активный маршрут: неактивный маршрут ничего не стоит на каждое событие.
+    ``when`` — предикат состояния; его пересчитывает ``refresh()``, который
+    владелец маршрута вызывает после изменения своего состояния.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self._routes = {}
+        self._active = {}
+        self._listeners = {}
+
+    def route(self, event, handler, *, channels=None, guilds=None, check=None, when=None):
+        """Добавить маршрут; ``channels``/``guilds`` — множество ID или функция, его возвращающая"""
+        route = Route(event, handler, channels, guilds, check, when)
+        self._routes.setdefault(event, []).append(route)
+        self._update(event)
+        return route
+
+    def remove(self, route):
+        routes = self._routes.get(route.event, [])
+        if route in routes:
+            routes.remove(route)
+        self._update(route.event)
+
+    def refresh(self):
+        """Пересчитать ``when`` всех маршрутов и (от)ключить слушатели"""
+        for event in list(self._routes):
+            self._update(event)
+
+    def is_listening(self, event):
+        return event in self._listeners
+
+    def _update(self, event):
+        active = []
+        for route in self._routes.get(event, []):
+            route.active = route.when is None or bool(route.when())
+            if route.active:
+                active.append(route)
+        self._active[event] = active
+        if active and event not in self._listeners:
+            listener = self._make_listener(event)
+            self._listeners[event] = listener
+            self.bot.add_listener(listener, f'on_{event}')
+        elif not active and event in self._listeners:
+            self.bot.remove_listener(self._listeners.pop(event), f'on_{event}')
+
+    def _make_listener(self, event):
+        async def listener(*args):
+            for route in self._active.get(event, ()):
+                if route.matches(args):
+                    try:
+                        await route.handler(*args)
+                    except Exception as e:
+                        logger.error(f'Error in {event} route {route.handler.__qualname__}: {e}')
+        return listener
@@ -0,0 +1,83 @@
+def _guild_id(guild):
+    return getattr(guild, 'id', guild)
+
+
+class GuildConfig:
+    """Настройки гильдий: раздел ``guilds`` документа variables.json с индексом по ID гильдии.
+
+    Каждая гильдия — отдельный ключ раздела (в кластере — отдельная строка общей
+    базы), поэтому воркеры, настраивающие разные гильдии, не затирают друг друга.
+
+    Документы ``legacy`` (по умолчанию верхний уровень variables.json и
+    settings.json; модуль передаёт свой раздел) — прежняя конфигурация одного
+    сервера. Они действуют только для гильдии канала конфигурации из
+    settings.json, если в её секции ключа нет. ID этой гильдии запоминается в
+    хранилище, как только канал виден в кэше: воркер кластера без её шарда канала
+    не видит, и для него гильдия остаётся неизвестной, а не прежней.
+    """
+    def __init__(self, bot, parent='variables', legacy=None):
+        self.bot = bot
+        self.parent = parent
+        self.legacy = legacy or (parent, 'settings')
+        self.name = bot.config.section(parent, 'guilds')
+        self._index = {}
+        self._legacy_channel = None
+        self._legacy_guild = None
+        bot.config.add_listener(self.name, self._rebuild)
+        self._rebuild(bot.config.data(self.name))
+
+    def close(self):
+        self.bot.config.remove_listener(self.name, self._rebuild)
+
+    def _rebuild(self, data):
+        # Снимок не меняется, поэтому секции можно держать в индексе без копирования
+        self._index = {int(gid): section for gid, section in data.items()}
+
+    def _is_legacy(self, guild_id):
+        channel_id = self.bot.config.get('settings', 'config_channel_id')
+        if channel_id != self._legacy_channel:
+            self._legacy_channel = channel_id
+            self._legacy_guild = self.bot.store.meta_get(f'legacy_guild:{channel_id}')
+        if self._legacy_guild is None:
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                return False
+            self._legacy_guild = channel.guild.id
+            self.bot.store.meta_set(f'legacy_guild:{channel_id}', self._legacy_guild)
+        return guild_id == self._legacy_guild
+
+    def get(self, guild, key, default=None):
+        """Значение для гильдии (объект или ID); ``None`` — прежняя глобальная настройка"""
+        guild_id = _guild_id(guild)
+        section = self._index.get(guild_id)
+        if section is not None and key in section:
+            return section[key]
+        if guild_id is None or self._is_legacy(guild_id):
+            for doc in self.legacy:
+                value = self.bot.config.get(doc, key)
+                if value is not None:
+                    return value
+        return default
+
+    def channel(self, guild, key):
+        """Канал из настроек гильдии; None, если его нет в кэше или он принадлежит другой гильдии"""
+        channel = self.bot.get_channel(self.get(guild, key))
+        if channel is None or getattr(channel, 'guild', None) is None or channel.guild.id != _guild_id(guild):
+            return None
+        return channel
+
+    async def is_bot_admin(self, user, channel):
+        """Управление всем ботом (settings.json, метрики, перезагрузка модулей): владелец бота
+        или канал конфигурации из settings.json, а не канал конфигурации отдельной гильдии"""
+        if channel is not None and channel.id == self.bot.config.get('settings', 'config_channel_id'):
+            return True
+        return await self.bot.is_owner(user)
+
+    def set(self, guild, key, value):
+        self.update(guild, {key: value})
+
+    def update(self, guild, values):
+        """Записать ключи в секцию гильдии; меняется только ключ этой гильдии"""
+        guild_id = str(_guild_id(guild))
+        section = self.bot.config.get(self.name, guild_id, {})
+        self.bot.config.set(self.name, guild_id, {**section, **values})
@@ -0,0 +1,162 @@
+import random
+
+
+class _Node:
+    __slots__ = ('start', 'end', 'key', 'value', 'prio', 'max_end', 'left', 'right')
+
+    def __init__(self, start, end, key, value):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.value = value
+        self.prio = random.random()
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+    def update(self):
+        m = self.end
+        if self.left is not None and self.left.max_end > m:
+            m = self.left.max_end
+        if self.right is not None and self.right.max_end > m:
+            m = self.right.max_end
+        self.max_end = m
+
+
+def _rotate_right(node):
+    left = node.left
+    node.left, left.right = left.right, node
+    node.update()
+    left.update()
+    return left
+
+
+def _rotate_left(node):
+    right = node.right
+    node.right, right.left = right.left, node
+    node.update()
+    right.update()
+    return right
+
+
+class IntervalTree:
+    """Дерево полуинтервалов [start, end) на декартовом дереве с максимумом конца в узлах.
+
+    Вставка и удаление — O(log n), поиск пересечений — O(log n + k) в среднем.
+    ``key`` однозначно определяет интервал (например, id заявки).
+    """
+    def __init__(self):
+        self.root = None
+        self._spans = {}
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, key):
+        return key in self._spans
+
+    def add(self, start, end, key, value=None):
+        if key in self._spans:
+            self.remove(key)
+        self._spans[key] = (start, key)
+        self.root = self._insert(self.root, _Node(start, end, key, value))
+
+    def _insert(self, node, new):
+        if node is None:
+            return new
+        if (new.start, new.key) < (node.start, node.key):
+            node.left = self._insert(node.left, new)
+            if node.left.prio > node.prio:
+                node = _rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.prio > node.prio:
+                node = _rotate_left(node)
+        node.update()
+        return node
+
+    def remove(self, key):
+        order = self._spans.pop(key, None)
+        if order is not None:
+            self.root = self._delete(self.root, order)
+
+    def _delete(self, node, order):
+        if node is None:
+            return None
+        current = (node.start, node.key)
+        if order < current:
+            node.left = self._delete(node.left, order)
+        elif order > current:
+            node.right = self._delete(node.right, order)
+        else:
+            if node.left is None:
+                return node.right
+            if node.right is None:
+                return node.left
+            if node.left.prio > node.right.prio:
+                node = _rotate_right(node)
+                node.right = self._delete(node.right, order)
+            else:
+                node = _rotate_left(node)
+                node.left = self._delete(node.left, order)
+        node.update()
+        return node
+
+    def overlap(self, start, end):
+        """Значения всех интервалов, пересекающихся с [start, end), по возрастанию начала"""
+        result, stack, node = [], [], self.root
+        while stack or node is not None:
+            # Спускаемся влево, отсекая поддеревья, где все интервалы кончаются до start
+            while node is not None and node.max_end > start:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                break
+            node = stack.pop()
+            if node.start >= end:
+                break
+            if node.end > start:
+                result.append(node.value)
+            node = node.right
+        return result
+
+
+class ConflictEngine:
+    """Отсутствия по отделам в памяти: по дереву интервалов на каждую роль-отдел сервера.
+
+    Хранит записи ``RequestRecord`` (или любые объекты с теми же атрибутами).
+    """
+    def __init__(self):
+        self.trees = {}
+        self._records = {}  # request_id -> запись
+
+    def seed(self, records):
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        if record.department is None or record.start_ts is None or record.end_ts is None:
+            return
+        if record.end_ts < record.start_ts:
+            return
+        key = (record.guild_id, record.department)
+        tree = self.trees.get(key)
+        if tree is None:
+            tree = self.trees[key] = IntervalTree()
+        tree.add(record.start_ts, record.end_ts, record.id, record)
+        self._records[record.id] = record
+
+    def set_status(self, request_id, status):
+        record = self._records.get(request_id)
+        if record is not None:
+            record.status = status
+
+    def remove(self, request_id):
+        record = self._records.pop(request_id, None)
+        if record is not None:
+            self.trees[(record.guild_id, record.department)].remove(request_id)
+
+    def check(self, guild_id, department, start_ts, end_ts):
+        """Одобренные и ожидающие отсутствия отдела сервера, пересекающиеся с периодом"""
+        tree = self.trees.get((guild_id, department))
+        return tree.overlap(start_ts, end_ts) if tree is not None else []
@@ -0,0 +1,99 @@
+import asyncio
+import contextlib
+import logging
+import signal
+
+import discord
+
+logger = logging.getLogger('discord')
+
+
+class Lifecycle:
+    """Жизненный цикл процесса бота: однократные шаги после on_ready, учёт
+    обработчиков в работе и остановка по SIGTERM/SIGINT с ожиданием их завершения.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.closing = False
+        self._once = {}
+        self._inflight = set()
+
+    async def once(self, key, func):
+        """Выполнить ``func()`` один раз за процесс, сколько бы раз ни пришёл on_ready.
+
+        Повторный вызов во время выполнения ждёт тот же запуск; после ошибки шаг можно повторить.
+        """
+        task = self._once.get(key)
+        if task is None:
+            task = self._once[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda t: self._forget_failed(key, t))
+        await asyncio.shield(task)
+
+    def _forget_failed(self, key, task):
+        if task.cancelled() or task.exception() is not None:
+            self._once.pop(key, None)
+
+    def forget(self, key):
+        """Разрешить шагу ``key`` выполниться снова (например, после выгрузки cog'а)"""
+        self._once.pop(key, None)
+
+    @contextlib.contextmanager
+    def inflight(self):
+        """Отметить текущую задачу как обработчик, которого ждёт остановка"""
+        task = asyncio.current_task()
+        self._inflight.add(task)
+        try:
+            yield
+        finally:
+            self._inflight.discard(task)
+
+    async def drain(self, timeout):
+        """Дождаться обработчиков в работе не дольше ``timeout``; вернуть число незавершённых"""
+        tasks = [t for t in self._inflight if t is not asyncio.current_task()]
+        if not tasks:
+            return 0
+        _, pending = await asyncio.wait(tasks, timeout=max(0, timeout))
+        if pending:
+            logger.warning(f'{len(pending)} handlers still running at shutdown deadline')
+        return len(pending)
+
+    def request_shutdown(self):
+        if not self.closing:
+            logger.info('Shutdown requested, draining in-flight work')
+            asyncio.get_running_loop().create_task(self.bot.close())
+
+    def run(self, token):
+        """Замена ``bot.run``: сигналы остановки ведут к ``bot.close()`` с дренажом, а не к обрыву процесса"""
+        async def runner():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    loop.add_signal_handler(sig, self.request_shutdown)
+                except NotImplementedError:  # Windows: остаётся KeyboardInterrupt
+                    pass
+            async with self.bot:
+                await self.bot.start(token)
+        try:
+            asyncio.run(runner())
+        except KeyboardInterrupt:
+            pass
+
+
+def track_ui(lifecycle):
+    """Учитывать обработку всех View и Modal как работу, которую ждёт остановка"""
+    if getattr(discord.ui.View, '_lifecycle_tracked', False):
+        return
+    view_task = discord.ui.View._scheduled_task
+    modal_task = discord.ui.Modal._scheduled_task
+
+    async def view_scheduled_task(self, *args, **kwargs):
+        with lifecycle.inflight():
+            return await view_task(self, *args, **kwargs)
+
+    async def modal_scheduled_task(self, *args, **kwargs):
+        with lifecycle.inflight():
+            return await modal_task(self, *args, **kwargs)
+
+    discord.ui.View._scheduled_task = view_scheduled_task
+    discord.ui.Modal._scheduled_task = modal_scheduled_task
+    discord.ui.View._lifecycle_tracked = True
@@ -0,0 +1,175 @@
+import ast
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import os
+import time
+
+logger = logging.getLogger('discord')
+
+DEFAULT_META = {'depends': [], 'priority': 0, 'lazy': False}
+
+
+def read_meta(path):
+    """Прочитать словарь ``EXTENSION`` из исходника модуля без его выполнения"""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    meta = dict(DEFAULT_META)
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name) and node.targets[0].id == 'EXTENSION'):
+            meta.update(ast.literal_eval(node.value))
+    return meta
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ExtensionSpec:
+    __slots__ = ('name', 'path', 'meta', 'digest', 'import_time', 'init_time', 'error')
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.meta = dict(DEFAULT_META)
+        self.digest = None
+        self.import_time = 0.0
+        self.init_time = 0.0
+        self.error = None
+
+
+class ExtensionLoader:
+    """Загрузчик расширений с учётом зависимостей.
+
+    Метаданные модуля задаются необязательным словарём на уровне модуля::
+
+        EXTENSION = {'depends': ['cogs.config'], 'priority': 0, 'lazy': False}
+
+    Чтение исходников и компиляция байткода выполняются в пуле потоков.
+    Сам импорт модуля и ``setup()`` выполняются в цикле событий синхронно,
+    поэтому расширения загружаются по одному: сначала зависимости, среди
+    готовых к загрузке — по убыванию ``priority``. ``lazy``-модули
+    откладываются до первой неизвестной команды.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.specs = {}
+        self.lazy = []
+        self.dirs = []
+
+    def discover(self, package, directory):
+        """Найти расширения в каталоге; возвращает имена впервые найденных"""
+        if (package, directory) not in self.dirs:
+            self.dirs.append((package, directory))
+        found = []
+        for fn in sorted(os.listdir(directory)):
+            if fn.endswith('.py') and fn != '__init__.py':
+                name = f'{package}.{fn[:-3]}'
+                if name not in self.specs:
+                    self.specs[name] = ExtensionSpec(name, os.path.join(directory, fn))
+                    found.append(name)
+        return found
+
+    def order(self, names):
+        """Упорядочить расширения так, чтобы зависимости шли раньше зависящих"""
+        names, result, seen = set(names), [], set()
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in self.specs[name].meta['depends']:
+                if dep in names and dep in self.specs:
+                    visit(dep)
+            result.append(name)
+        for name in sorted(names):
+            visit(name)
+        return result
+
+    def dependents(self, name):
+        """Все расширения, прямо или транзитивно зависящие от ``name``"""
+        result, stack = set(), [name]
+        while stack:
+            current = stack.pop()
+            for spec in self.specs.values():
+                if current in spec.meta['depends'] and spec.name not in result:
+                    result.add(spec.name)
+                    stack.append(spec.name)
+        return result
+
+    def _prepare(self, spec):
+        started = time.perf_counter()
+        try:
+            spec.digest = file_digest(spec.path)
+            spec.meta = read_meta(spec.path)
+            # Компиляция в __pycache__: exec_module в load_extension возьмёт готовый байткод
+            module_spec = importlib.util.find_spec(spec.name)
+            module_spec.loader.get_code(spec.name)
+        except Exception as e:
+            spec.error = e
+        spec.import_time = time.perf_counter() - started
+
+    async def _load(self, spec):
+        started = time.perf_counter()
+        try:
+            await self.bot.load_extension(spec.name)
+        except Exception as e:
+            spec.error = e
+            logger.error(f'Failed to load extension {spec.name}: {e}')
+        spec.init_time = time.perf_counter() - started
+
+    async def _load_ordered(self, names):
+        """Загружать волнами: в каждой волне по одному все расширения с уже загруженными
+        зависимостями, в порядке ``priority`` (время загрузки каждого меряется отдельно)"""
+        remaining = set(names)
+        while remaining:
+            ready = [self.specs[n] for n in remaining
+                     if all(d in self.bot.extensions for d in self.specs[n].meta['depends'])]
+            if not ready:
+                for n in remaining:
+                    self.specs[n].error = self.specs[n].error or RuntimeError('unresolved dependencies')
+                    logger.error(f'Skipped extension {n}: dependencies '
+                                 f"{self.specs[n].meta['depends']} are not loaded")
+                return
+            ready.sort(key=lambda s: (-s.meta['priority'], s.name))
+            for spec in ready:
+                await self._load(spec)
+            remaining.difference_update(s.name for s in ready)
+
+    async def load_all(self):
+        await asyncio.gather(*(asyncio.to_thread(self._prepare, s) for s in self.specs.values()))
+        eager = []
+        for spec in self.specs.values():
+            if spec.error is not None:
+                logger.error(f'Failed to prepare extension {spec.name}: {spec.error}')
+            elif spec.meta['lazy']:
+                self.lazy.append(spec.name)
+            else:
+                eager.append(spec.name)
+        await self._load_ordered(eager)
+        self.log_report()
+
+    async def load_lazy(self):
+        """Загрузить отложенные модули; True, если что-то было загружено"""
+        if not self.lazy:
+            return False
+        names, self.lazy = self.lazy, []
+        # Зависимости lazy-модулей тоже могут быть отложены — догружаем их вместе
+        await self._load_ordered(names)
+        logger.info(f"Loaded lazy extensions: {', '.join(names)}")
+        return True
+
+    def log_report(self):
+        rows = [f"{'extension':<32}{'import ms':>11}{'cog init ms':>13}{'total ms':>10}  status"]
+        for spec in sorted(self.specs.values(), key=lambda s: -(s.import_time + s.init_time)):
+            if spec.error is not None:
+                status = f'error: {spec.error}'
+            elif spec.name in self.lazy:
+                status = 'lazy'
+            else:
+                status = 'ok'
+            rows.append(f'{spec.name:<32}{spec.import_time * 1000:>11.1f}{spec.init_time * 1000:>13.1f}'
+                        f'{(spec.import_time + spec.init_time) * 1000:>10.1f}  {status}')
+        logger.info('Extension startup timings:\n' + '\n'.join(rows))
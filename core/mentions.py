@@ -0,0 +1,107 @@
+class GuildMentionIndex:
+    """Индекс одной гильдии: имя роли -> роль и роль-источник -> (упоминания, разрешённые ID)"""
+    __slots__ = ('by_name', 'resolved')
+
+    def __init__(self):
+        self.by_name = {}
+        self.resolved = {}
+
+
+class MentionIndex:
+    """Предрасчитанная карта упоминаний для всех гильдий.
+
+    Заменяет перебор ``guild.roles`` на каждую заявку словарными обращениями;
+    пересчитывается точечно при изменении карты или ролей гильдии.
+    """
+    def __init__(self, mapping=None):
+        self.mapping = {}
+        self._order = {}  # роль-источник -> позиция в карте (для выбора отдела)
+        self._targets = {}  # имя упоминаемой роли -> множество ролей-источников
+        self._guilds = {}
+        self.set_mapping(mapping or {})
+
+    def set_mapping(self, mapping):
+        """Полностью заменить карту упоминаний"""
+        self.mapping = {src: list(tgts) for src, tgts in mapping.items()}
+        self._order = {src: i for i, src in enumerate(self.mapping)}
+        self._targets = {}
+        for src, tgts in self.mapping.items():
+            for tgt in tgts:
+                self._targets.setdefault(tgt, set()).add(src)
+        for idx in self._guilds.values():
+            idx.resolved = {src: self._resolve(idx, src) for src in self.mapping}
+
+    def update_source(self, source, targets):
+        """Добавить или обновить одну запись карты"""
+        for tgt in self.mapping.get(source, []):
+            self._targets.get(tgt, set()).discard(source)
+        self.mapping[source] = list(targets)
+        self._order.setdefault(source, len(self._order))
+        for tgt in self.mapping[source]:
+            self._targets.setdefault(tgt, set()).add(source)
+        for idx in self._guilds.values():
+            idx.resolved[source] = self._resolve(idx, source)
+
+    def _resolve(self, idx, source):
+        mentions, allowed = [], set()
+        for tgt in self.mapping.get(source, []):
+            role = idx.by_name.get(tgt)
+            if role is not None:
+                mentions.append(role.mention)
+                allowed.add(role.id)
+        return tuple(mentions), frozenset(allowed)
+
+    def _guild(self, guild):
+        idx = self._guilds.get(guild.id)
+        if idx is None:
+            idx = self.rebuild_guild(guild)
+        return idx
+
+    def rebuild_guild(self, guild):
+        """Построить индекс гильдии с нуля"""
+        idx = GuildMentionIndex()
+        for role in guild.roles:
+            # Как и discord.utils.get, при совпадении имён берём первую роль
+            idx.by_name.setdefault(role.name, role)
+        idx.resolved = {src: self._resolve(idx, src) for src in self.mapping}
+        self._guilds[guild.id] = idx
+        return idx
+
+    def drop_guild(self, guild_id):
+        self._guilds.pop(guild_id, None)
+
+    def _refresh_names(self, guild, names):
+        idx = self._guilds.get(guild.id)
+        if idx is None:
+            return
+        for name in names:
+            idx.by_name.pop(name, None)
+        for role in guild.roles:
+            if role.name in names:
+                idx.by_name.setdefault(role.name, role)
+        for name in names:
+            for src in self._targets.get(name, ()):
+                idx.resolved[src] = self._resolve(idx, src)
+
+    def role_changed(self, role, before=None):
+        """Учесть создание, переименование или удаление роли"""
+        names = {role.name}
+        if before is not None:
+            names.add(before.name)
+        self._refresh_names(role.guild, names)
+
+    def department(self, roles):
+        """Роль-отдел пользователя: роль-источник, стоящая в карте раньше остальных"""
+        found = [r for r in roles if r.name in self._order]
+        return min(found, key=lambda r: self._order[r.name]) if found else None
+
+    def resolve(self, guild, roles):
+        """Упоминания и разрешённые ID ролей для набора ролей пользователя"""
+        idx = self._guild(guild)
+        mentions, allowed = [], set()
+        for role in roles:
+            entry = idx.resolved.get(role.name)
+            if entry:
+                mentions.extend(entry[0])
+                allowed.update(entry[1])
+        return list(dict.fromkeys(mentions)), allowed
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+
+import discord
+
+logger = logging.getLogger('discord')
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# approve:123 -> approve: идентификаторы заявок не должны раздувать число серий
+_ID_SUFFIX = re.compile(r':\d+$')
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float('inf')
+        return float('inf')
+
+
+class Metrics:
+    """Метрики горячего пути: задержки, ошибки и текущие вызовы по (тип, cog, ключ)"""
+    def __init__(self):
+        self.started = time.time()
+        self.latency = {}
+        self.errors = {}
+        self.in_flight = {}
+        self.events = {}
+        self._server = None
+
+    @asynccontextmanager
+    async def track(self, kind, owner, key):
+        labels = (kind, owner, _ID_SUFFIX.sub('', str(key)))
+        self.in_flight[labels] = self.in_flight.get(labels, 0) + 1
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(*labels)
+            raise
+        finally:
+            self.in_flight[labels] -= 1
+            hist = self.latency.get(labels)
+            if hist is None:
+                hist = self.latency[labels] = Histogram()
+            hist.observe(time.perf_counter() - started)
+
+    def error(self, kind, owner, key):
+        labels = (kind, owner, _ID_SUFFIX.sub('', str(key)))
+        self.errors[labels] = self.errors.get(labels, 0) + 1
+
+    def event(self, name):
+        self.events[name] = self.events.get(name, 0) + 1
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        def fmt(labels):
+            kind, owner, key = (str(v).replace('\\', '\\\\').replace('"', '\\"') for v in labels)
+            return f'kind="{kind}",cog="{owner}",key="{key}"'
+        lines = ['# TYPE emsbot_handler_seconds histogram']
+        for labels, hist in self.latency.items():
+            cumulative = 0
+            for bound, c in zip(BUCKETS + ('+Inf',), hist.counts):
+                cumulative += c
+                lines.append(f'emsbot_handler_seconds_bucket{{{fmt(labels)},le="{bound}"}} {cumulative}')
+            lines.append(f'emsbot_handler_seconds_sum{{{fmt(labels)}}} {hist.total}')
+            lines.append(f'emsbot_handler_seconds_count{{{fmt(labels)}}} {hist.count}')
+        lines.append('# TYPE emsbot_handler_errors_total counter')
+        lines += [f'emsbot_handler_errors_total{{{fmt(l)}}} {v}' for l, v in self.errors.items()]
+        lines.append('# TYPE emsbot_handler_in_flight gauge')
+        lines += [f'emsbot_handler_in_flight{{{fmt(l)}}} {v}' for l, v in self.in_flight.items()]
+        lines.append('# TYPE emsbot_gateway_events_total counter')
+        lines += [f'emsbot_gateway_events_total{{event="{e}"}} {v}' for e, v in self.events.items()]
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host, port):
+        """Поднять HTTP-эндпоинт /metrics"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f'Metrics endpoint listening on http://{host}:{port}/metrics')
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                body, status = self.render().encode(), b'200 OK'
+            else:
+                body, status = b'not found\n', b'404 Not Found'
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+
+def _owner(obj):
+    cog = getattr(obj, 'cog', None)
+    return getattr(cog, 'qualified_name', None) or type(obj).__module__
+
+
+def instrument_ui(metrics):
+    """Обернуть обработку всех View и Modal: задержка, ошибки, текущие вызовы по custom_id"""
+    if getattr(discord.ui.View, '_instrumented', False):
+        return
+    view_task = discord.ui.View._scheduled_task
+    modal_task = discord.ui.Modal._scheduled_task
+    view_error = discord.ui.View.on_error
+    modal_error = discord.ui.Modal.on_error
+
+    async def view_scheduled_task(self, item, interaction, *args, **kwargs):
+        async with metrics.track('view', _owner(self), item.custom_id or type(item).__name__):
+            return await view_task(self, item, interaction, *args, **kwargs)
+
+    async def modal_scheduled_task(self, interaction, *args, **kwargs):
+        async with metrics.track('modal', _owner(self), type(self).__name__):
+            return await modal_task(self, interaction, *args, **kwargs)
+
+    async def view_on_error(self, interaction, error, item):
+        metrics.error('view', _owner(self), item.custom_id or type(item).__name__)
+        return await view_error(self, interaction, error, item)
+
+    async def modal_on_error(self, interaction, error):
+        metrics.error('modal', _owner(self), type(self).__name__)
+        return await modal_error(self, interaction, error)
+
+    discord.ui.View._scheduled_task = view_scheduled_task
+    discord.ui.Modal._scheduled_task = modal_scheduled_task
+    discord.ui.View.on_error = view_on_error
+    discord.ui.Modal.on_error = modal_on_error
+    discord.ui.View._instrumented = True
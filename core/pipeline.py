@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import discord
+
+logger = logging.getLogger('discord')
+
+# Discord разрешает не больше 10 embed'ов в одном сообщении
+MAX_DIGEST = 10
+
+
+class QueueFull(Exception):
+    pass
+
+
+class SendJob:
+    """Одно исходящее сообщение: содержимое, фабрика view и колбэк после отправки.
+
+    ``on_failed(error)`` — корутина, вызываемая, если сообщение так и не ушло после всех повторов.
+    ``message_id`` — задача правит это уже опубликованное сообщение вместо отправки нового
+    (текст не трогается, если ``content`` не задан; без view кнопки убираются).
+
+    ``meta`` — произвольные данные отправителя, нужные функции объединения дайджеста.
+    ``replay`` — ``(вид, данные)`` для восстановления view и колбэка, если задача
+    не успела уйти до остановки бота (см. ``SendPipeline.set_replay``).
+    """
+    __slots__ = ('channel', 'content', 'embeds', 'build_view', 'on_sent', 'on_failed', 'digest_key', 'meta',
+                 'replay', 'message_id', 'enqueued_at')
+
+    def __init__(self, channel, content=None, embeds=(), build_view=None, on_sent=None, digest_key=None, meta=None,
+                 replay=None, on_failed=None, message_id=None):
+        self.channel = channel
+        self.content = content
+        self.embeds = list(embeds)
+        self.build_view = build_view
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.digest_key = digest_key
+        self.meta = meta
+        self.replay = replay
+        self.message_id = message_id
+        self.enqueued_at = time.monotonic()
+
+    def to_record(self):
+        """Сериализуемая копия для сохранения в хранилище"""
+        return {
+            'channel_id': self.channel.id,
+            'content': self.content,
+            'embeds': [e.to_dict() for e in self.embeds],
+            'replay': list(self.replay) if self.replay else None,
+        }
+
+    @classmethod
+    def from_record(cls, channel, record):
+        return cls(channel, content=record['content'], embeds=[discord.Embed.from_dict(e) for e in record['embeds']],
+                   replay=record['replay'])
+
+
+class TokenBucket:
+    """Темп отправки в один маршрут: ``rate`` сообщений в секунду, всплеск до ``capacity``"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ChannelQueue:
+    __slots__ = ('queue', 'bucket', 'worker', 'sent', 'failed', 'latencies', 'carry', 'batch')
+
+    def __init__(self, size, rate, burst):
+        self.queue = asyncio.Queue(maxsize=size)
+        self.bucket = TokenBucket(rate, burst)
+        self.worker = None
+        self.sent = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=500)
+        self.carry = None
+        # Задачи, взятые из очереди и ещё не отправленные (при остановке сохраняются)
+        self.batch = []
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class SendPipeline:
+    """Очередь исходящих сообщений с ограниченным размером на канал.
+
+    Модалы ставят готовые сообщения в очередь и сразу отвечают пользователю;
+    по одному воркеру на канал отправляют их с ограничением темпа и
+    повторяют при 429/5xx с экспоненциальной задержкой и случайным разбросом.
+    """
+    def __init__(self, queue_size=100, rate=1.0, burst=5, retries=5):
+        self.queue_size = queue_size
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self._channels = {}
+        self._digests = {}
+        self._replays = {}
+        # После drain задачи не отправляются, а копятся для сохранения
+        self.closed = False
+        self._held = []
+
+    def set_digest(self, key, window, combine):
+        """Объединять задачи с ``digest_key == key``, пришедшие в течение ``window`` секунд.
+
+        ``combine(jobs)`` получает список задач и возвращает одну SendJob.
+        """
+        self._digests[key] = (window, combine)
+
+    def set_replay(self, kind, restore):
+        """``restore(job)`` восстанавливает view/колбэк задачи вида ``kind`` после перезапуска;
+        возвращает задачу или None, если отправлять уже нечего"""
+        self._replays[kind] = restore
+
+    def restore(self, channel, record):
+        """Задача из сохранённой записи или None"""
+        job = SendJob.from_record(channel, record)
+        if job.replay:
+            restore = self._replays.get(job.replay[0])
+            if restore is not None:
+                return restore(job)
+        return job
+
+    def replay(self, records, get_channel):
+        """Поставить в очередь сохранённые записи; возвращает ID обработанных"""
+        done = []
+        for record in records:
+            channel = get_channel(record['channel_id'])
+            if channel is None:
+                # Канал другого воркера кластера (или удалён) — запись остаётся
+                continue
+            job = self.restore(channel, record)
+            if job is not None:
+                try:
+                    self.submit(job)
+                except QueueFull:
+                    break
+            done.append(record['id'])
+        return done
+
+    def _channel(self, channel_id):
+        cq = self._channels.get(channel_id)
+        if cq is None:
+            cq = self._channels[channel_id] = ChannelQueue(self.queue_size, self.rate, self.burst)
+        return cq
+
+    def is_full(self, channel_id):
+        cq = self._channels.get(channel_id)
+        return cq is not None and cq.queue.full()
+
+    def submit(self, job):
+        """Поставить задачу в очередь канала; QueueFull, если очередь заполнена"""
+        if self.closed:
+            self._held.append(job)
+            return
+        cq = self._channel(job.channel.id)
+        try:
+            cq.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(job.channel.id) from None
+        if cq.worker is None or cq.worker.done():
+            cq.worker = asyncio.get_running_loop().create_task(self._work(cq))
+
+    async def _next_batch(self, cq):
+        job = cq.carry or await cq.queue.get()
+        cq.carry = None
+        digest = self._digests.get(job.digest_key)
+        if digest is None:
+            return job
+        window, combine = digest
+        batch = cq.batch = [job]
+        deadline = time.monotonic() + window
+        while len(batch) < MAX_DIGEST:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                nxt = await asyncio.wait_for(cq.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if nxt.digest_key != job.digest_key:
+                cq.carry = nxt
+                break
+            batch.append(nxt)
+        return batch[0] if len(batch) == 1 else combine(batch)
+
+    async def _work(self, cq):
+        while not cq.queue.empty() or cq.carry is not None:
+            job = await self._next_batch(cq)
+            if not cq.batch:
+                cq.batch = [job]
+            try:
+                msg = await self._send(cq, job)
+            except Exception as e:
+                cq.failed += 1
+                logger.error(f'Failed to send queued message to {job.channel.id}: {e}')
+                if job.on_failed is not None:
+                    try:
+                        await job.on_failed(e)
+                    except Exception as e:
+                        logger.error(f'on_failed callback failed: {e}')
+                continue
+            finally:
+                cq.batch = []
+            cq.sent += 1
+            cq.latencies.append(time.monotonic() - job.enqueued_at)
+            if job.on_sent is not None:
+                try:
+                    job.on_sent(msg)
+                except Exception as e:
+                    logger.error(f'on_sent callback failed: {e}')
+
+    async def _send(self, cq, job):
+        view = job.build_view() if job.build_view else None
+        for attempt in range(self.retries):
+            await cq.bucket.acquire()
+            try:
+                kwargs = {'embeds': job.embeds}
+                if job.content is not None or job.message_id is None:
+                    kwargs['content'] = job.content
+                if job.message_id is not None:
+                    return await job.channel.get_partial_message(job.message_id).edit(view=view, **kwargs)
+                if view is not None:
+                    kwargs['view'] = view
+                return await job.channel.send(**kwargs)
+            except discord.HTTPException as e:
+                if attempt == self.retries - 1 or not (e.status == 429 or e.status >= 500):
+                    raise
+                delay = min(30.0, 2 ** attempt) * (0.5 + random.random())
+                logger.warning(f'Send to {job.channel.id} failed with {e.status}, retry in {delay:.1f}s')
+                await asyncio.sleep(delay)
+
+    def stats(self):
+        """Глубина очереди, счётчики и задержка (постановка -> отправка) по каналам"""
+        result = {}
+        for channel_id, cq in self._channels.items():
+            result[channel_id] = {
+                'depth': cq.queue.qsize() + (cq.carry is not None),
+                'sent': cq.sent,
+                'failed': cq.failed,
+                'p50': _percentile(cq.latencies, 0.5),
+                'p99': _percentile(cq.latencies, 0.99),
+            }
+        return result
+
+    async def drain(self, timeout):
+        """Дать очередям отправиться не дольше ``timeout`` секунд, остальное отложить в ``unsent()``"""
+        self.closed = True
+        workers = [cq.worker for cq in self._channels.values() if cq.worker is not None and not cq.worker.done()]
+        if workers and timeout > 0:
+            await asyncio.wait(workers, timeout=timeout)
+        self.stop()
+        for cq in self._channels.values():
+            self._held += cq.batch
+            if cq.carry is not None:
+                self._held.append(cq.carry)
+            while not cq.queue.empty():
+                self._held.append(cq.queue.get_nowait())
+            cq.batch, cq.carry = [], None
+
+    def unsent(self):
+        """Задачи, не отправленные к остановке (включая поставленные после drain)"""
+        held, self._held = self._held, []
+        return held
+
+    def stop(self):
+        for cq in self._channels.values():
+            if cq.worker is not None:
+                cq.worker.cancel()
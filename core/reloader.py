@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+
+from core.loader import file_digest, read_meta
+
+logger = logging.getLogger('discord')
+
+
+class ReloadResult:
+    __slots__ = ('name', 'action', 'elapsed', 'error')
+
+    def __init__(self, name, action, elapsed=0.0, error=None):
+        self.name = name
+        self.action = action
+        self.elapsed = elapsed
+        self.error = error
+
+
+class ExtensionReloader:
+    """Перезагрузка только изменившихся расширений и зависящих от них.
+
+    Изменения определяются по SHA-1 содержимого файла, посчитанному
+    загрузчиком при старте и обновляемому после каждой перезагрузки.
+    """
+    def __init__(self, bot, loader):
+        self.bot = bot
+        self.loader = loader
+        self._lock = asyncio.Lock()
+        self._watcher = None
+
+    def _scan(self):
+        """Новые digest'ы всех расширений (выполняется в пуле потоков)"""
+        for package, directory in self.loader.dirs:
+            self.loader.discover(package, directory)
+        digests = {}
+        for name, spec in self.loader.specs.items():
+            try:
+                digests[name] = file_digest(spec.path)
+            except FileNotFoundError:
+                digests[name] = None
+        return digests
+
+    async def changed(self):
+        digests = await asyncio.to_thread(self._scan)
+        return {n: d for n, d in digests.items() if d != self.loader.specs[n].digest}
+
+    async def reload_changed(self):
+        """Перезагрузить изменённые расширения; возвращает список ReloadResult"""
+        async with self._lock:
+            changed = await self.changed()
+            results = []
+            for name, digest in list(changed.items()):
+                if digest is None:
+                    continue
+                spec = self.loader.specs[name]
+                try:
+                    spec.meta = await asyncio.to_thread(read_meta, spec.path)
+                except Exception as e:
+                    # Файл с ошибкой не трогаем: digest прежний, при следующей проверке он снова в списке
+                    del changed[name]
+                    spec.error = e
+                    logger.error(f'Failed to reload extension {name}: {e}')
+                    results.append(ReloadResult(name, 'failed', error=e))
+            targets = set(changed)
+            for name in changed:
+                targets |= self.loader.dependents(name)
+            for name in self.loader.order(targets):
+                results.append(await self._reload_one(name, changed.get(name, self.loader.specs[name].digest)))
+            for name, digest in changed.items():
+                if digest is None:
+                    del self.loader.specs[name]
+            return results
+
+    async def _reload_one(self, name, digest):
+        spec = self.loader.specs[name]
+        started = time.perf_counter()
+        loaded = name in self.bot.extensions
+        try:
+            if digest is None:
+                action = 'unloaded'
+                if loaded:
+                    await self.bot.unload_extension(name)
+            elif loaded:
+                action = 'reloaded'
+                await self.bot.reload_extension(name)
+            elif name in self.loader.lazy:
+                action = 'lazy'
+            else:
+                action = 'loaded'
+                await self.bot.load_extension(name)
+            # Новый digest запоминаем только после успешной перезагрузки
+            spec.digest = digest
+            spec.error = None
+        except Exception as e:
+            action = 'failed'
+            spec.error = e
+            logger.error(f'Failed to reload extension {name}: {e}')
+        elapsed = time.perf_counter() - started
+        return ReloadResult(name, action, elapsed, spec.error)
+
+    def start_watching(self, interval=1.0, debounce=0.5):
+        """Автоматически перезагружать изменённые файлы"""
+        if self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch(interval, debounce))
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch(self, interval, debounce):
+        failed = None
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                first = await self.changed()
+                # Сломанный файл не перезагружаем на каждом шаге — ждём следующей правки
+                if not first or first == failed:
+                    continue
+                # Ждём, пока редактор допишет файлы, и только потом перезагружаем
+                await asyncio.sleep(debounce)
+                if await self.changed() != first:
+                    continue
+                results = await self.reload_changed()
+            except Exception:
+                logger.exception('Hot reload failed')
+                continue
+            failed = first if any(r.error for r in results) else None
+            for r in results:
+                logger.info(f'Hot reload: {r.name} {r.action} in {r.elapsed * 1000:.1f} ms'
+                            + (f' ({r.error})' if r.error else ''))
@@ -0,0 +1,104 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger('discord')
+
+# Дольше не спим: переведённые системные часы не сдвинут срабатывание больше чем на час
+MAX_SLEEP = 3600
+
+
+class Scheduler:
+    """Таймеры на куче по unix-времени: один ``loop.call_at`` на ближайший срок,
+    сколько бы таймеров ни было.
+
+    Ключ таймера уникален: повторный ``schedule`` с тем же ключом заменяет срок,
+    ``cancel`` снимает таймер (запись в куче удаляется лениво).
+    """
+    def __init__(self):
+        self._heap = []
+        self._timers = {}
+        self._seq = itertools.count()
+        self._handle = None
+        self._handle_when = None
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def schedule(self, when, key, callback, *args):
+        """Вызвать корутину ``callback(*args)`` в момент ``when`` (unix-время)"""
+        entry = (when, next(self._seq), key)
+        self._timers[key] = (entry, callback, args)
+        heapq.heappush(self._heap, entry)
+        self._arm()
+
+    def load(self, timers):
+        """Массовая загрузка ``(when, key, callback, args)`` одной перестройкой кучи"""
+        for when, key, callback, args in timers:
+            entry = (when, next(self._seq), key)
+            self._timers[key] = (entry, callback, args)
+            self._heap.append(entry)
+        heapq.heapify(self._heap)
+        self._arm()
+
+    def cancel(self, key):
+        if self._timers.pop(key, None) is None:
+            return False
+        # Снятые таймеры копятся в куче — перестраиваем, когда их становится больше живых
+        if len(self._heap) > 2 * len(self._timers) + 64:
+            self._heap = [item[0] for item in self._timers.values()]
+            heapq.heapify(self._heap)
+        return True
+
+    def _live(self, entry):
+        item = self._timers.get(entry[2])
+        return item is not None and item[0] is entry
+
+    def _arm(self):
+        while self._heap and not self._live(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return
+        when = self._heap[0][0]
+        if self._handle is not None:
+            if self._handle_when <= when:
+                return
+            self._handle.cancel()
+        loop = asyncio.get_running_loop()
+        delay = min(max(0, when - time.time()), MAX_SLEEP)
+        self._handle = loop.call_at(loop.time() + delay, self._fire)
+        self._handle_when = when
+
+    def _fire(self):
+        self._handle = None
+        loop = asyncio.get_running_loop()
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if not self._live(entry):
+                continue
+            _, callback, args = self._timers.pop(entry[2])
+            task = loop.create_task(callback(*args))
+            self._tasks.add(task)
+            task.add_done_callback(self._done)
+        self._arm()
+
+    def _done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Scheduled task failed', exc_info=task.exception())
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._heap.clear()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
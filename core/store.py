@@ -0,0 +1,330 @@
+import json
+import sqlite3
+import threading
+import time
+
+# Миграции схемы: индекс в списке + 1 == PRAGMA user_version после применения
+MIGRATIONS = [
+    """
+    CREATE TABLE requests (
+        id           INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id     INTEGER,
+        channel_id   INTEGER,
+        message_id   INTEGER,
+        requester_id INTEGER NOT NULL,
+        kind         TEXT NOT NULL,
+        status       TEXT NOT NULL DEFAULT 'pending',
+        start_ts     REAL,
+        end_ts       REAL,
+        allowed      TEXT NOT NULL DEFAULT '[]',
+        reason       TEXT,
+        created_at   REAL NOT NULL,
+        decided_by   INTEGER,
+        decided_at   REAL,
+        decision_reason TEXT
+    );
+    CREATE INDEX idx_requests_status    ON requests(status);
+    CREATE INDEX idx_requests_requester ON requests(requester_id);
+    CREATE INDEX idx_requests_channel   ON requests(channel_id);
+    CREATE INDEX idx_requests_range     ON requests(start_ts, end_ts);
+    CREATE INDEX idx_requests_message   ON requests(message_id);
+    """,
+    # Аналитика: отдел, длительность и интервальный индекс (R*Tree в минутах) по периоду заявки.
+    # Перевёрнутые периоды (подавались до проверки дат) в индекс не попадают: R*Tree их не примет
+    """
+    ALTER TABLE requests ADD COLUMN department TEXT;
+    ALTER TABLE requests ADD COLUMN department_id INTEGER;
+    ALTER TABLE requests ADD COLUMN duration_minutes INTEGER;
+    CREATE INDEX idx_requests_department ON requests(department, status);
+    CREATE INDEX idx_requests_kind_start ON requests(kind, start_ts);
+    CREATE VIRTUAL TABLE request_span USING rtree_i32(id, start_min, end_min);
+    INSERT INTO request_span
+        SELECT id, CAST(start_ts / 60 AS INTEGER), CAST(end_ts / 60 AS INTEGER) + 1
+        FROM requests WHERE start_ts IS NOT NULL AND end_ts IS NOT NULL AND end_ts >= start_ts;
+    CREATE TRIGGER request_span_insert AFTER INSERT ON requests
+    WHEN NEW.start_ts IS NOT NULL AND NEW.end_ts IS NOT NULL AND NEW.end_ts >= NEW.start_ts BEGIN
+        INSERT INTO request_span
+        VALUES (NEW.id, CAST(NEW.start_ts / 60 AS INTEGER), CAST(NEW.end_ts / 60 AS INTEGER) + 1);
+    END;
+    CREATE TRIGGER request_span_delete AFTER DELETE ON requests BEGIN
+        DELETE FROM request_span WHERE id = OLD.id;
+    END;
+    """,
+    # Общая конфигурация для нескольких процессов: по строке на ключ документа
+    """
+    CREATE TABLE config (
+        doc     TEXT NOT NULL,
+        key     TEXT NOT NULL,
+        value   TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (doc, key)
+    );
+    CREATE INDEX idx_config_version ON config(doc, version);
+    """,
+    """
+    CREATE TABLE meta (
+        key   TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """,
+    # Выгрузка истории по дате подачи
+    """
+    CREATE INDEX idx_requests_created ON requests(created_at);
+    """,
+    # Неотправленные при остановке сообщения очереди, отправляются при следующем запуске
+    """
+    CREATE TABLE outbox (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id INTEGER NOT NULL,
+        content    TEXT,
+        embeds     TEXT NOT NULL DEFAULT '[]',
+        replay     TEXT,
+        created_at REAL NOT NULL
+    );
+    """,
+]
+
+
+class RequestRecord:
+    """Компактная копия заявки для долгоживущих структур в памяти (без словаря на экземпляр)"""
+    __slots__ = ('id', 'guild_id', 'channel_id', 'message_id', 'requester_id', 'kind', 'status',
+                 'start_ts', 'end_ts', 'department')
+
+    def __init__(self, id, requester_id, kind=None, status='pending', start_ts=None, end_ts=None,
+                 department=None, guild_id=None, channel_id=None, message_id=None):
+        self.id = id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.requester_id = requester_id
+        self.kind = kind
+        self.status = status
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.department = department
+
+    @classmethod
+    def from_row(cls, row):
+        keys = row.keys()
+        return cls(**{k: row[k] for k in cls.__slots__ if k in keys})
+
+
+class RequestStore:
+    """Хранилище заявок на SQLite (WAL), переживающее перезапуск бота"""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        # Базу могут открывать несколько процессов (режим кластера)
+        self.db.execute('PRAGMA busy_timeout=5000')
+        self._migrate()
+
+    def _migrate(self):
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        for i, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self._lock:
+                self.db.executescript(f'BEGIN; {script}; PRAGMA user_version = {i}; COMMIT;')
+
+    def meta_get(self, key, default=None):
+        """Служебное значение бота (хэш команд, ID сообщений панелей)"""
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def meta_set(self, key, value):
+        with self._lock:
+            self.db.execute(
+                'INSERT INTO meta (key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                (key, json.dumps(value))
+            )
+
+    def outbox_add(self, records):
+        """Сохранить неотправленные сообщения (``SendJob.to_record()``) одной транзакцией"""
+        with self._lock:
+            self.db.execute('BEGIN')
+            self.db.executemany(
+                'INSERT INTO outbox (channel_id, content, embeds, replay, created_at) VALUES (?, ?, ?, ?, ?)',
+                [(r['channel_id'], r['content'], json.dumps(r['embeds']), json.dumps(r['replay']), time.time())
+                 for r in records]
+            )
+            self.db.execute('COMMIT')
+
+    def outbox(self):
+        rows = self.db.execute('SELECT * FROM outbox ORDER BY id').fetchall()
+        return [{'id': row['id'], 'channel_id': row['channel_id'], 'content': row['content'],
+                 'embeds': json.loads(row['embeds']), 'replay': json.loads(row['replay'])} for row in rows]
+
+    def outbox_delete(self, ids):
+        with self._lock:
+            self.db.executemany('DELETE FROM outbox WHERE id = ?', [(i,) for i in ids])
+
+    def close(self):
+        self.db.close()
+
+    def create(self, *, requester_id, kind, guild_id=None, start_ts=None, end_ts=None,
+               allowed=(), reason=None, department=None, department_id=None):
+        """Создать заявку в статусе pending, вернуть её id"""
+        duration = None
+        if start_ts is not None and end_ts is not None:
+            duration = int((end_ts - start_ts) // 60)
+        with self._lock:
+            cur = self.db.execute(
+                'INSERT INTO requests (guild_id, requester_id, kind, start_ts, end_ts, allowed, reason, created_at,'
+                ' department, department_id, duration_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (guild_id, requester_id, kind, start_ts, end_ts, json.dumps(list(allowed)), reason,
+                 time.time(), department, department_id, duration)
+            )
+        return cur.lastrowid
+
+    def attach_message(self, request_id, channel_id, message_id):
+        """Привязать заявку к опубликованному сообщению"""
+        with self._lock:
+            self.db.execute('UPDATE requests SET channel_id = ?, message_id = ? WHERE id = ?',
+                            (channel_id, message_id, request_id))
+
+    def decide(self, request_id, status, decided_by, reason=None):
+        """Зафиксировать решение; возвращает False, если заявка уже рассмотрена"""
+        with self._lock:
+            cur = self.db.execute(
+                "UPDATE requests SET status = ?, decided_by = ?, decided_at = ?, decision_reason = ?"
+                " WHERE id = ? AND status = 'pending'",
+                (status, decided_by, time.time(), reason, request_id)
+            )
+        return cur.rowcount > 0
+
+    def get(self, request_id):
+        return self.db.execute('SELECT * FROM requests WHERE id = ?', (request_id,)).fetchone()
+
+    def pending(self):
+        """Все ожидающие решения заявки с опубликованным сообщением — одним запросом"""
+        return self.db.execute(
+            "SELECT * FROM requests WHERE status = 'pending' AND message_id IS NOT NULL ORDER BY id"
+        ).fetchall()
+
+    def scheduled(self, now):
+        """Заявки, которым нужны таймеры: ожидающие решения и одобренные, ещё не закончившиеся"""
+        return self.db.execute(
+            "SELECT * FROM requests WHERE status = 'pending' OR (status = 'approved' AND end_ts > ?)",
+            (now,)
+        ).fetchall()
+
+    def iter_created(self, start_ts, end_ts, guild_id=None, batch=500):
+        """Заявки, поданные в [start_ts, end_ts), порциями по ``batch`` строк.
+
+        Читает через отдельное соединение только для чтения (WAL не блокирует запись),
+        поэтому генератор можно перебирать в другом потоке.
+        """
+        sql = 'SELECT * FROM requests WHERE created_at >= ? AND created_at < ?'
+        params = [start_ts, end_ts]
+        if guild_id is not None:
+            sql += ' AND guild_id = ?'
+            params.append(guild_id)
+        db = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        db.row_factory = sqlite3.Row
+        try:
+            cur = db.execute(sql + ' ORDER BY created_at', params)
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            db.close()
+
+    def overlapping(self, start_ts, end_ts, statuses=('pending', 'approved'), kinds=None, guild_id=None):
+        """Заявки, период которых пересекается с [start_ts, end_ts), через интервальный индекс"""
+        sql = ('SELECT r.* FROM request_span s JOIN requests r ON r.id = s.id'
+               ' WHERE s.start_min <= ? AND s.end_min >= ? AND r.start_ts < ? AND r.end_ts > ?'
+               f" AND r.status IN ({','.join('?' * len(statuses))})")
+        params = [int(end_ts // 60) + 1, int(start_ts // 60), end_ts, start_ts, *statuses]
+        if kinds:
+            sql += f" AND r.kind IN ({','.join('?' * len(kinds))})"
+            params += kinds
+        if guild_id is not None:
+            sql += ' AND r.guild_id = ?'
+            params.append(guild_id)
+        return self.db.execute(sql + ' ORDER BY r.department, r.start_ts', params).fetchall()
+
+    def active(self, kinds, since_ts):
+        """Ожидающие и одобренные заявки вида ``kinds`` с отделом, не закончившиеся к ``since_ts``"""
+        rows = self.db.execute(
+            "SELECT * FROM requests"
+            " WHERE status IN ('pending', 'approved') AND department IS NOT NULL AND end_ts > ?"
+            f" AND kind IN ({','.join('?' * len(kinds))})",
+            (since_ts, *kinds)
+        )
+        return [RequestRecord.from_row(row) for row in rows]
+
+    def pending_created(self, guild_id=None):
+        """Время создания всех ожидающих заявок (по индексу статуса)"""
+        sql = "SELECT created_at FROM requests WHERE status = 'pending'"
+        params = []
+        if guild_id is not None:
+            sql += ' AND guild_id = ?'
+            params.append(guild_id)
+        return [row[0] for row in self.db.execute(sql, params)]
+
+    def minutes_by_week(self, kind, since_ts, guild_id=None):
+        """Сумма минут одобренных заявок вида ``kind`` по пользователю и неделе начиная с ``since_ts``"""
+        sql = ("SELECT requester_id, strftime('%Y-%W', start_ts, 'unixepoch', 'localtime') AS week,"
+               ' SUM(duration_minutes) AS minutes, COUNT(*) AS count FROM requests'
+               " WHERE kind = ? AND start_ts >= ? AND status = 'approved'")
+        params = [kind, since_ts]
+        if guild_id is not None:
+            sql += ' AND guild_id = ?'
+            params.append(guild_id)
+        sql += ' GROUP BY requester_id, week ORDER BY week DESC, minutes DESC'
+        return self.db.execute(sql, params).fetchall()
+
+    def config_version(self, doc):
+        """Версия документа конфигурации: меняется при любой записи или удалении ключа из любого процесса"""
+        return tuple(self.db.execute('SELECT MAX(version), COUNT(*) FROM config WHERE doc = ?', (doc,)).fetchone())
+
+    def config_load(self, doc):
+        """Документ конфигурации и его версия; None вместо документа, если его нет"""
+        rows = self.db.execute('SELECT key, value, version FROM config WHERE doc = ?', (doc,)).fetchall()
+        if not rows:
+            return None, (None, 0)
+        return {r['key']: json.loads(r['value']) for r in rows}, (max(r['version'] for r in rows), len(rows))
+
+    def config_save(self, doc, values, replace=False, removed=()):
+        """Записать ключи документа (значения — готовый JSON) и удалить ``removed``;
+        ``replace`` удаляет все остальные ключи. Возвращает версии документа до и после записи"""
+        with self._lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                previous = self.config_version(doc)
+                version = self.db.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM config').fetchone()[0]
+                if replace:
+                    self.db.execute(
+                        f"DELETE FROM config WHERE doc = ? AND key NOT IN ({','.join('?' * len(values))})",
+                        (doc, *values)
+                    )
+                self.db.executemany(
+                    'INSERT INTO config (doc, key, value, version) VALUES (?, ?, ?, ?)'
+                    ' ON CONFLICT (doc, key) DO UPDATE SET value = excluded.value, version = excluded.version',
+                    [(doc, k, v, version) for k, v in values.items()]
+                )
+                if removed:
+                    self.db.executemany('DELETE FROM config WHERE doc = ? AND key = ?', [(doc, k) for k in removed])
+                version = self.config_version(doc)
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        return previous, version
+
+    def pending_messages(self):
+        """Сообщения с незакрытыми заявками: message_id -> все заявки сообщения по порядку embed'ов"""
+        rows = self.db.execute(
+            "SELECT * FROM requests WHERE message_id IN"
+            " (SELECT message_id FROM requests WHERE status = 'pending' AND message_id IS NOT NULL)"
+            " ORDER BY message_id, id"
+        ).fetchall()
+        result = {}
+        for row in rows:
+            result.setdefault(row['message_id'], []).append(row)
+        return result
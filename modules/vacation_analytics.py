@@ -0,0 +1,165 @@
+import asyncio
+import csv
+import io
+import json
+import tempfile
+import time
+import discord
+from discord.ext import commands
+from datetime import datetime, timedelta
+from modules.vacation_request import VACATION_KINDS, BREAK_KIND
+
+EXTENSION = {'depends': ['modules.vacation_request']}
+
+# Границы распределения возраста ожидающих заявок (часы)
+AGE_BUCKETS = [(1, '< 1 ч'), (6, '1–6 ч'), (24, '6–24 ч'), (72, '1–3 дн.'), (None, '> 3 дн.')]
+
+STATUS_NAMES = {'pending': 'ожидает', 'approved': 'одобрено'}
+
+# Выгрузка держится в памяти до этого размера, дальше уходит во временный файл
+EXPORT_SPOOL = 4 * 1024 * 1024
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = ['id', 'guild_id', 'kind', 'status', 'requester_id', 'department', 'start', 'end',
+                  'duration_minutes', 'reason', 'created_at', 'decided_by', 'decided_at', 'decision_reason']
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec='seconds') if ts is not None else None
+
+def export_record(row):
+    record = {k: row[k] for k in EXPORT_COLUMNS if k in row.keys()}
+    record.update(start=_iso(row['start_ts']), end=_iso(row['end_ts']),
+                  created_at=_iso(row['created_at']), decided_at=_iso(row['decided_at']))
+    return record
+
+def write_export(rows, fmt, fp):
+    """Записать заявки в текстовый поток по одной строке; возвращает их число"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(fp, EXPORT_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(export_record(row))
+            count += 1
+    else:
+        for row in rows:
+            fp.write(json.dumps(export_record(row), ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+def _fmt(ts):
+    return datetime.fromtimestamp(ts).strftime('%d.%m')
+
+def _max_concurrent(rows):
+    """Максимум одновременно отсутствующих (заметание по концам интервалов)"""
+    points = sorted([(r['start_ts'], 1) for r in rows] + [(r['end_ts'], -1) for r in rows])
+    best = cur = 0
+    for _, delta in points:
+        cur += delta
+        best = max(best, cur)
+    return best
+
+class VacationAnalytics(commands.Cog, name="Vacation Analytics"):
+    """Отчёты по истории заявок на отпуск и перерыв из хранилища"""
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.hybrid_command(name='absences')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
+    async def absences(self, ctx, start: str, end: str):
+        """Пересекающиеся отпуска по отделам за период: !absences 01.07.2026 31.07.2026"""
+        try:
+            sd = datetime.strptime(start, '%d.%m.%Y')
+            ed = datetime.strptime(end, '%d.%m.%Y') + timedelta(days=1)
+        except ValueError:
+            return await ctx.send(':x: Формат дат: DD.MM.YYYY')
+        rows = self.bot.store.overlapping(sd.timestamp(), ed.timestamp(), kinds=VACATION_KINDS,
+                                          guild_id=ctx.guild.id if ctx.guild else None)
+        if not rows:
+            return await ctx.send(':information_source: Отсутствий за период нет.')
+        by_dept = {}
+        for row in rows:
+            by_dept.setdefault(row['department'] or 'Без отдела', []).append(row)
+        embed = discord.Embed(title=f'Отсутствия {start} — {end}', color=discord.Color.blurple())
+        for dept, items in list(by_dept.items())[:25]:
+            lines = [f"<@{r['requester_id']}> {_fmt(r['start_ts'])}–{_fmt(r['end_ts'] - 1)} "
+                     f"({STATUS_NAMES.get(r['status'], r['status'])})" for r in items]
+            embed.add_field(
+                name=f'{dept}: {len(items)}, одновременно до {_max_concurrent(items)}',
+                value='\n'.join(lines)[:1024], inline=False
+            )
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name='pending_age')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
+    async def pending_age(self, ctx):
+        """Распределение возраста заявок, ожидающих решения"""
+        now = time.time()
+        ages = [(now - created) / 3600 for created in
+                self.bot.store.pending_created(ctx.guild.id if ctx.guild else None)]
+        if not ages:
+            return await ctx.send(':information_source: Ожидающих заявок нет.')
+        counts = [0] * len(AGE_BUCKETS)
+        for age in ages:
+            for i, (limit, _) in enumerate(AGE_BUCKETS):
+                if limit is None or age < limit:
+                    counts[i] += 1
+                    break
+        lines = [f'{label}: {n}' for (_, label), n in zip(AGE_BUCKETS, counts)]
+        lines.append(f'Старейшая: {max(ages):.1f} ч')
+        await ctx.send('**Ожидающие заявки:**\n' + '\n'.join(lines))
+
+    @commands.hybrid_command(name='break_minutes')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
+    async def break_minutes(self, ctx, weeks: int = 4):
+        """Минуты одобренных перерывов по пользователям за последние недели"""
+        since = (datetime.now() - timedelta(weeks=weeks)).timestamp()
+        rows = self.bot.store.minutes_by_week(BREAK_KIND, since, ctx.guild.id if ctx.guild else None)
+        if not rows:
+            return await ctx.send(':information_source: Перерывов за период нет.')
+        by_week = {}
+        for row in rows:
+            by_week.setdefault(row['week'], []).append(row)
+        embed = discord.Embed(title=f'Перерывы за {weeks} нед.', color=discord.Color.orange())
+        for week, items in list(by_week.items())[:25]:
+            lines = [f"<@{r['requester_id']}>: {r['minutes'] or 0} мин. ({r['count']})" for r in items]
+            embed.add_field(name=f'Неделя {week}', value='\n'.join(lines)[:1024], inline=False)
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name='export')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
+    async def export(self, ctx, start: str, end: str, fmt: str = 'csv'):
+        """Выгрузка заявок, поданных за период, в CSV или JSONL: !export 01.07.2026 31.07.2026 jsonl"""
+        try:
+            sd = datetime.strptime(start, '%d.%m.%Y')
+            ed = datetime.strptime(end, '%d.%m.%Y') + timedelta(days=1)
+        except ValueError:
+            return await ctx.send(':x: Формат дат: DD.MM.YYYY')
+        fmt = fmt.lower()
+        if fmt not in EXPORT_FORMATS:
+            return await ctx.send(f":x: Формат: {', '.join(EXPORT_FORMATS)}")
+        await ctx.defer()
+        rows = self.bot.store.iter_created(sd.timestamp(), ed.timestamp(), ctx.guild.id if ctx.guild else None)
+        fp = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL)
+
+        def dump():
+            # utf-8-sig: Excel открывает CSV с кириллицей без перекодировки
+            text = io.TextIOWrapper(fp, encoding='utf-8-sig' if fmt == 'csv' else 'utf-8', newline='')
+            count = write_export(rows, fmt, text)
+            text.flush()
+            text.detach()
+            return count
+
+        with fp:
+            count = await asyncio.to_thread(dump)
+            size = fp.tell()
+            if not count:
+                return await ctx.send(':information_source: Заявок за период нет.')
+            limit = ctx.guild.filesize_limit if ctx.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+            if size > limit:
+                return await ctx.send(f':x: Выгрузка {size // 1024} КиБ больше лимита вложений, сузьте период')
+            fp.seek(0)
+            name = f"requests_{sd:%Y%m%d}_{ed - timedelta(days=1):%Y%m%d}.{fmt}"
+            await ctx.send(f'Заявок: {count}', file=discord.File(fp, filename=name))
+
+async def setup(bot):
+    await bot.add_cog(VacationAnalytics(bot))
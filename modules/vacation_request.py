@@ -1,94 +1,468 @@
-import os
+import asyncio
+import csv
+import io
 import json
+import logging
+import re
+import time
+from typing import Literal, Optional
 import discord
 from discord.ext import commands
 from discord.ui import View, Button, Modal, TextInput
 from datetime import datetime, timedelta
+from core.guilds import GuildConfig
+from core.mentions import MentionIndex
+from core.intervals import ConflictEngine
+from core.pipeline import QueueFull, SendJob
+from core.scheduler import Scheduler
+from core.store import RequestRecord
+
+logger = logging.getLogger('discord')
+
+# Упоминание бота в ответе мастеру настройки (нужно без intent'а message_content)
+MENTION_RE = re.compile(r'<@!?\d+>')
+
+# Виды заявок (сохраняются в хранилище как kind)
+VACATION_KINDS = ('ICC Отпуск', 'OC Отпуск')
+BREAK_KIND = 'Перерыв'
+
+# Каналы для заявок, которые спрашивает мастер настройки сервера
+CHANNEL_KEYS = [
+    'request_channel_id',
+    'icc_vacation_channel_id',
+    'oc_vacation_channel_id',
+    'break_channel_id'
+]
+
+# Больше карта упоминаний не бывает; защищает от случайно приложенного большого файла
+MAX_IMPORT_SIZE = 1024 * 1024
+
+def parse_mention_map(data, filename):
+    """Карта упоминаний из JSON (``{"роль": ["роль", ...]}`` или variables.json целиком)
+    или CSV (``роль,упоминаемая роль,...`` в строке)"""
+    text = data.decode('utf-8-sig')
+    if filename.lower().endswith('.csv'):
+        mapping = {}
+        for row in csv.reader(io.StringIO(text)):
+            cells = [c.strip() for c in row if c.strip()]
+            if cells:
+                mapping[cells[0]] = cells[1:]
+        return mapping
+    mapping = json.loads(text)
+    if isinstance(mapping, dict) and isinstance(mapping.get('mention_map'), dict):
+        mapping = mapping['mention_map']
+    if not isinstance(mapping, dict) or not all(
+            isinstance(v, list) and all(isinstance(t, str) for t in v) for v in mapping.values()):
+        raise ValueError('ожидается объект {"роль": ["роль", ...]}')
+    return {k.strip(): [t.strip() for t in v] for k, v in mapping.items()}
+
+def validate_mention_map(guild, mapping):
+    """Ошибки карты: пустые списки упоминаний и роли, которых нет на сервере"""
+    names = {r.name for r in guild.roles} if guild else None
+    errors = []
+    for source, targets in mapping.items():
+        if not targets:
+            errors.append(f'`{source}`: пустой список упоминаний')
+        if names is not None:
+            missing = [n for n in dict.fromkeys([source, *targets]) if n not in names]
+            if missing:
+                errors.append(f"`{source}`: нет ролей {', '.join(missing)}")
+    return errors
+
+def diff_mention_maps(old, new):
+    """Строки разницы карт: + добавлено, ~ изменено, - удалено"""
+    lines = []
+    for source, targets in new.items():
+        if source not in old:
+            lines.append(f"+ {source}: {', '.join(targets)}")
+        elif old[source] != targets:
+            lines.append(f"~ {source}: {', '.join(old[source])} -> {', '.join(targets)}")
+    lines += [f'- {source}' for source in old if source not in new]
+    return lines
 
 class VacationRequestModule(commands.Cog, name="Vacation Request Module"):
     """Модуль для подачи заявок на отпуск и перерыва,
     интерактивная настройка каналов и карты упоминаний ролей"""
     def __init__(self, bot):
         self.bot = bot
-        self.vars_path = os.path.join(os.path.dirname(__file__), 'variables.json')
-        with open(self.vars_path, 'r', encoding='utf-8') as vf:
-            self.cfg = json.load(vf)
-        # Каналы для заявок
-        keys = [
-            'request_channel_id',
-            'icc_vacation_channel_id',
-            'oc_vacation_channel_id',
-            'break_channel_id'
-        ]
-        self._queue = [k for k in keys if not self.cfg.get(k)]
-        self._asking = False
-
-    @commands.command(name='mention_config')
-    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.settings.get('config_channel_id'))
+        # Своя конфигурация модуля: прежние общие каналы и карта упоминаний одного сервера
+        self.vars = self.bot.config.namespace('vacation', legacy=CHANNEL_KEYS + ['mention_map'])
+        # Каналы и карта упоминаний у каждого сервера свои; прежние общие — из раздела модуля
+        self.guilds = GuildConfig(self.bot, legacy=(self.vars.name, 'settings'))
+        # Состояние мастера настройки по ID гильдии
+        self._wizards = {}
+        # Индексы ролей для быстрого разрешения упоминаний, по гильдии (строятся при первом обращении)
+        self._mentions = {}
+        # Карты упоминаний лежат в разделе гильдий, прежняя общая — в разделе модуля
+        for name in (self.guilds.name, self.vars.name):
+            self.bot.config.add_listener(name, self._on_reload)
+        # Отсутствия по отделам для проверки пересечений при подаче заявки
+        self.conflicts = ConflictEngine()
+        # Напоминания, истечение и уведомления об окончании; открытые view рассмотрения по id заявки
+        self.timers = Scheduler()
+        self.approvals = {}
+        # Постоянные view: кнопки работают на старых сообщениях после перезапуска
+        self.views = [RequestButtons(self), MentionConfigView(self)]
+        self._panel_checked = set()
+
+    def cog_unload(self):
+        for name in (self.guilds.name, self.vars.name):
+            self.bot.config.remove_listener(name, self._on_reload)
+        self.guilds.close()
+        self.bot.lifecycle.forget(f'{self.qualified_name}:configure')
+        self.bot.router.remove(self._wizard_route)
+        for view in self.views:
+            view.stop()
+        self.timers.stop()
+
+    def _on_reload(self, data):
+        # Новый снимок настроек — перестраиваем индексы, только если карта гильдии действительно другая
+        for guild_id, index in self._mentions.items():
+            mapping = self.guilds.get(guild_id, 'mention_map', {})
+            if mapping != index.mapping:
+                index.set_mapping(mapping)
+
+    def mentions_for(self, guild):
+        """Индекс упоминаний сервера"""
+        index = self._mentions.get(guild.id)
+        if index is None:
+            index = self._mentions[guild.id] = MentionIndex(self.guilds.get(guild, 'mention_map', {}))
+        return index
+
+    def _wizard_channels(self):
+        return {self.guilds.get(guild_id, 'config_channel_id')
+                for guild_id, state in self._wizards.items() if state.asking}
+
+    async def cog_load(self):
+        # Ответы мастеру настройки слушаем только пока он ждёт ответа и только в канале конфигурации
+        self._wizard_route = self.bot.router.route(
+            'message', self._on_wizard_message,
+            channels=self._wizard_channels,
+            check=lambda message: not message.author.bot and message.guild is not None,
+            when=lambda: any(state.asking for state in self._wizards.values())
+        )
+        for view in self.views:
+            self.bot.add_view(view)
+        # Восстанавливаем кнопки рассмотрения для всех незакрытых заявок одним запросом
+        for message_id, rows in self.bot.store.pending_messages().items():
+            entries = [(row['id'], set(json.loads(row['allowed'])), idx)
+                       for idx, row in enumerate(rows) if row['status'] == 'pending']
+            self.bot.add_view(ApprovalView(self, entries), message_id=message_id)
+        self.conflicts.seed(self.bot.store.active(VACATION_KINDS, time.time()))
+        self._restore_timers()
+        # Дайджест заявок на перерыв: одно сообщение на всплеск заявок
+        window = self.bot.config.get('settings', 'break_digest_window', 0, type=float)
+        if window:
+            self.bot.pipeline.set_digest('break', window, lambda jobs: combine_requests(self, jobs))
+        # Заявки, не опубликованные до остановки бота, публикуются заново с кнопками
+        self.bot.pipeline.set_replay('approval', self._replay_approval)
+        # Решения, не показанные в сообщении до остановки, дописываются в него
+        self.bot.pipeline.set_replay('decision', self._replay_decision)
+
+    def _replay_approval(self, job):
+        rows = [self.bot.store.get(rid) for rid in job.replay[1]]
+        entries = [(row['id'], set(json.loads(row['allowed'])), idx)
+                   for idx, row in enumerate(rows) if row is not None and row['status'] == 'pending']
+        if not entries:
+            return None
+        job.build_view = lambda: ApprovalView(self, entries)
+        job.on_sent = _attach(self.bot.store, job.channel.id, [rid for rid, _, _ in entries])
+        job.on_failed = _failed(self, [rid for rid, _, _ in entries])
+        return job
+
+    def _replay_decision(self, job):
+        data = job.replay[1]
+        # Кнопки оставшихся заявок уже восстановлены в cog_load — правка оставляет тот же view
+        views = [self.approvals[rid][0] for rid in data['pending'] if rid in self.approvals]
+        view = views[0] if views else None
+        job.message_id = data['message_id']
+        job.build_view = lambda: view
+        return job
+
+    def _timer_settings(self):
+        get = self.bot.config.get
+        return (get('settings', 'request_remind_hours', 0, type=float) * 3600,
+                get('settings', 'request_expire_hours', 0, type=float) * 3600)
+
+    def _pending_timers(self, rid, created_at, end_ts, now):
+        # Заявка, не рассмотренная к концу своего периода, истекает раньше срока
+        remind, expire = self._timer_settings()
+        timers = []
+        if remind:
+            timers.append((max(created_at + remind, now), (rid, 'remind'), self._remind, (rid,)))
+        if expire:
+            deadline = created_at + expire if end_ts is None else min(created_at + expire, end_ts)
+            timers.append((deadline, (rid, 'expire'), self._expire, (rid,)))
+        return timers
+
+    def _restore_timers(self):
+        """Таймеры всех незакрытых заявок из хранилища — одним запросом и одной перестройкой кучи"""
+        now = time.time()
+        timers = []
+        for row in self.bot.store.scheduled(now):
+            if row['status'] == 'pending':
+                timers += self._pending_timers(row['id'], row['created_at'], row['end_ts'], now)
+            else:
+                timers.append((row['end_ts'], (row['id'], 'end'), self._notify_end, (row['id'],)))
+        self.timers.load(timers)
+
+    def track_request(self, rid, end_ts):
+        """Поставить таймеры новой заявки"""
+        now = time.time()
+        for when, key, callback, args in self._pending_timers(rid, now, end_ts, now):
+            self.timers.schedule(when, key, callback, *args)
+
+    def request_decided(self, rid, status):
+        """Снять таймеры ожидания; у одобренной заявки ждём окончания периода"""
+        self.timers.cancel((rid, 'remind'))
+        self.timers.cancel((rid, 'expire'))
+        if status != 'approved':
+            return
+        row = self.bot.store.get(rid)
+        if row['end_ts'] and row['end_ts'] > time.time():
+            self.timers.schedule(row['end_ts'], (rid, 'end'), self._notify_end, rid)
+
+    def _own_channel(self, row):
+        # В кластере таймеры есть у каждого воркера, действует тот, кто видит канал заявки
+        if row['message_id'] is None:
+            return None
+        return self.bot.get_channel(row['channel_id'])
+
+    async def _remind(self, rid):
+        row = self.bot.store.get(rid)
+        if row is None or row['status'] != 'pending':
+            return
+        remind, _ = self._timer_settings()
+        if remind:
+            self.timers.schedule(time.time() + remind, (rid, 'remind'), self._remind, rid)
+        ch = self._own_channel(row)
+        if ch is None:
+            return
+        roles = ' '.join(f'<@&{r}>' for r in json.loads(row['allowed']))
+        hours = (time.time() - row['created_at']) / 3600
+        url = ch.get_partial_message(row['message_id']).jump_url
+        try:
+            self.bot.pipeline.submit(SendJob(
+                ch, content=f"{roles}\nЗаявка на {row['kind']} ждёт решения {hours:.0f} ч.: {url}"
+            ))
+        except QueueFull:
+            pass
+
+    async def _expire(self, rid):
+        row = self.bot.store.get(rid)
+        if row is None or row['status'] != 'pending':
+            return
+        ch = self._own_channel(row)
+        if ch is None and self.bot.get_guild(row['guild_id']) is None:
+            return
+        if not self.bot.store.decide(rid, 'expired', None, 'Истёк срок рассмотрения'):
+            return
+        self.request_decided(rid, 'expired')
+        self.conflicts.remove(rid)
+        approval = self.approvals.get(rid)
+        if ch is None or approval is None:
+            return
+        view, idx = approval
+        try:
+            message = await ch.fetch_message(row['message_id'])
+            embed = message.embeds[idx]
+            embed.color = discord.Color.dark_grey()
+            embed.add_field(name='Статус', value='Истекла без решения', inline=False)
+            await view.finish(message, rid, idx, embed)
+        except discord.HTTPException:
+            pass
+
+    async def _notify_end(self, rid):
+        row = self.bot.store.get(rid)
+        if row is None or row['status'] != 'approved':
+            return
+        ch = self._own_channel(row)
+        if ch is None:
+            return
+        text = 'перерыв окончен' if row['kind'] == BREAK_KIND else f"вернулся(ась) из отпуска ({row['kind']})"
+        try:
+            self.bot.pipeline.submit(SendJob(ch, content=f"<@{row['requester_id']}> {text}"))
+        except QueueFull:
+            pass
+
+    @commands.hybrid_command(name='setup')
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def setup_guild(self, ctx):
+        """Сделать этот канал каналом конфигурации сервера и настроить каналы заявок"""
+        self.guilds.set(ctx.guild, 'config_channel_id', ctx.channel.id)
+        self._wizards.pop(ctx.guild.id, None)
+        self.bot.router.refresh()
+        await ctx.send(':white_check_mark: Канал конфигурации сервера установлен')
+        await self._configure(ctx.guild)
+
+    @commands.hybrid_command(name='mention_config')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
     async def mention_config(self, ctx):
         """Открыть GUI для настройки карты упоминаний ролей"""
-        await ctx.send("Управление картой упоминаний:", view=MentionConfigView(self))
+        await ctx.send("Управление картой упоминаний:", view=self.views[1])
 
-    @commands.command(name='mention_show')
-    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.settings.get('config_channel_id'))
+    @commands.hybrid_command(name='mention_show')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
     async def mention_show(self, ctx):
         """Показать текущую карту упоминаний"""
-        mapping = self.cfg.get('mention_map', {})
+        mapping = self.guilds.get(ctx.guild, 'mention_map', {})
         if not mapping:
             return await ctx.send(':information_source: Карта упоминаний пуста.')
         lines = [f"**{role}**: {', '.join(targets)}" for role, targets in mapping.items()]
         text = "**Карта упоминаний:**\n" + "\n".join(lines)
         await ctx.send(text)
 
+    @commands.hybrid_command(name='mention_import')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
+    async def mention_import(self, ctx, file: discord.Attachment,
+                             apply: Optional[Literal['apply']] = None, replace: Optional[Literal['replace']] = None):
+        """Импорт карты упоминаний из JSON/CSV: ``!mention_import [apply] [replace]`` с файлом во вложении.
+
+        Без apply только показывает разницу; replace заменяет карту целиком вместо слияния.
+        """
+        apply, replace = apply is not None, replace is not None
+        if file.size > MAX_IMPORT_SIZE:
+            return await ctx.send(':x: Файл слишком большой')
+        try:
+            imported = parse_mention_map(await file.read(), file.filename)
+        except (ValueError, UnicodeDecodeError) as e:
+            return await ctx.send(f':x: Не удалось разобрать `{file.filename}`: {e}')
+        errors = validate_mention_map(ctx.guild, imported)
+        old = self.guilds.get(ctx.guild, 'mention_map', {})
+        new = dict(imported) if replace else {**old, **imported}
+        diff = diff_mention_maps(old, new)
+        summary = (f"{'Применено' if apply and not errors else 'Проверка'}: ролей в файле {len(imported)}, "
+                   f"изменений {len(diff)}, ошибок {len(errors)}")
+        report = '\n'.join(diff + [''] + errors if errors else diff) or 'Без изменений'
+        if apply and not errors and diff:
+            # Одна запись variables.json на весь импорт; индекс перестроит подписка
+            self.guilds.set(ctx.guild, 'mention_map', new)
+        elif apply and errors:
+            summary += ' — импорт не применён'
+        if len(report) > 1800:
+            await ctx.send(summary, file=discord.File(io.BytesIO(report.encode()), filename='mention_map.diff'))
+        else:
+            await ctx.send(f'{summary}\n```diff\n{report}\n```')
+
+    @commands.hybrid_command(name='mention_export')
+    @commands.check(lambda ctx: ctx.channel.id == ctx.bot.guild_config.get(ctx.guild, 'config_channel_id'))
+    async def mention_export(self, ctx):
+        """Выгрузить карту упоминаний в JSON (формат mention_import)"""
+        data = json.dumps(self.guilds.get(ctx.guild, 'mention_map', {}), ensure_ascii=False, indent=2).encode()
+        await ctx.send(file=discord.File(io.BytesIO(data), filename='mention_map.json'))
+
     @commands.Cog.listener()
     async def on_ready(self):
-        # При старте проверяем конфигурацию каналов
-        await self._ask_next()
-        if self._queue:
-            return
-        # Публикуем кнопки в канале заявок
-        req = self.cfg.get('request_channel_id')
-        if req:
-            ch = self.bot.get_channel(req)
-            if ch:
-                await ch.send("Выберите тип заявки:", view=RequestButtons(self))
-
-    async def _ask_next(self):
-        if self._asking or not self._queue:
+        # При старте проверяем конфигурацию каналов каждого сервера; переподключения её не повторяют
+        await self.bot.lifecycle.once(f'{self.qualified_name}:configure', self._configure_all)
+
+    async def _configure_all(self):
+        for guild in self.bot.guilds:
+            # Нет прав или канал недоступен на одном сервере — остальные всё равно настраиваются
+            try:
+                await self._configure(guild)
+            except discord.HTTPException as e:
+                logger.error(f'Failed to configure guild {guild.id}: {e}')
+
+    async def _configure(self, guild):
+        """Спросить недостающие каналы сервера или опубликовать кнопки заявок"""
+        if guild.id not in self._wizards:
+            queue = [k for k in CHANNEL_KEYS if not self.guilds.get(guild, k)]
+            if queue:
+                self._wizards[guild.id] = WizardState(queue)
+        if guild.id in self._wizards:
+            return await self._ask_next(guild)
+        # Публикуем кнопки в канале заявок (один раз за процесс, а не на каждое переподключение)
+        ch = self.guilds.channel(guild, 'request_channel_id')
+        if ch and guild.id not in self._panel_checked:
+            await self._publish_panel(ch)
+            self._panel_checked.add(guild.id)
+
+    async def _publish_panel(self, channel):
+        # Сообщение с кнопками переиспользуется: view зарегистрирован как постоянный
+        key = f'request_panel:{channel.id}'
+        message_id = self.bot.store.meta_get(key)
+        if message_id:
+            try:
+                await channel.fetch_message(message_id)
+                return
+            except discord.NotFound:
+                pass
+        message = await channel.send("Выберите тип заявки:", view=self.views[0])
+        self.bot.store.meta_set(key, message.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        if role.guild.id in self._mentions:
+            self._mentions[role.guild.id].role_changed(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        if after.guild.id in self._mentions:
+            self._mentions[after.guild.id].role_changed(after, before)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        if role.guild.id in self._mentions:
+            self._mentions[role.guild.id].role_changed(role)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self._wizards.pop(guild.id, None)
+        self._mentions.pop(guild.id, None)
+        self.bot.router.refresh()
+
+    async def _ask_next(self, guild):
+        state = self._wizards.get(guild.id)
+        if state is None or state.asking:
             return
-        key = self._queue[0]
+        key = state.queue[0]
         prompts = {
             'request_channel_id': 'Укажите ID канала для подачи заявок:',
             'icc_vacation_channel_id': 'Укажите ID канала для уведомлений о ICC отпуске:',
             'oc_vacation_channel_id': 'Укажите ID канала для уведомлений о OC отпуске:',
             'break_channel_id': 'Укажите ID канала для уведомлений о перерыве:'
         }
-        admin_ch = self.bot.get_channel(self.bot.settings.get('config_channel_id'))
+        admin_ch = self.guilds.channel(guild, 'config_channel_id')
         if admin_ch:
-            await admin_ch.send(prompts[key])
-            self._asking = True
+            prompt = prompts[key]
+            if not self.bot.intents.message_content:
+                prompt += ' (упомяните бота в ответе)'
+            await admin_ch.send(prompt)
+            state.asking = True
+            self.bot.router.refresh()
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        # Обработка ответов администратора для настройки каналов
-        if message.author.bot:
+    async def _on_wizard_message(self, message):
+        # Обработка ответов администратора для настройки каналов сервера
+        state = self._wizards.get(message.guild.id)
+        if state is None or not state.asking:
             return
-        cfg_ch = self.bot.settings.get('config_channel_id')
-        if message.channel.id != cfg_ch or not self._asking or not self._queue:
-            return
-        key = self._queue.pop(0)
+        key = state.queue[0]
         try:
-            val = int(message.content.strip())
+            val = int(MENTION_RE.sub('', message.content).strip())
         except ValueError:
-            await message.channel.send(f":x: Некорректный ID для `{key}`.")
-            self._queue.insert(0, key)
-            return
-        self.cfg[key] = val
-        with open(self.vars_path, 'w', encoding='utf-8') as vf:
-            json.dump(self.cfg, vf, indent=2, ensure_ascii=False)
+            return await message.channel.send(f":x: Некорректный ID для `{key}`.")
+        # Заявки и кнопки сервера не должны уходить в канал другого сервера
+        channel = self.bot.get_channel(val)
+        if channel is None or getattr(channel, 'guild', None) is None or channel.guild.id != message.guild.id:
+            return await message.channel.send(f":x: Канал {val} не найден на этом сервере.")
+        state.queue.pop(0)
+        self.guilds.set(message.guild, key, val)
         await message.channel.send(f":white_check_mark: Установлено `{key}` = {val}")
-        self._asking = False
-        await self._ask_next()
+        state.asking = False
+        if not state.queue:
+            del self._wizards[message.guild.id]
+        await self._configure(message.guild)
+        self.bot.router.refresh()
+
+class WizardState:
+    """Мастер настройки одного сервера: оставшиеся ключи и ожидание ответа"""
+    __slots__ = ('queue', 'asking')
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.asking = False
 
 # GUI для карты упоминаний
 class MentionConfigView(View):
@@ -102,7 +476,7 @@ class MentionConfigView(View):
 
     @discord.ui.button(label='Показать', style=discord.ButtonStyle.secondary, custom_id='mention_show')
     async def show_map(self, interaction: discord.Interaction, button: Button):
-        mapping = self.cog.cfg.get('mention_map', {})
+        mapping = self.cog.guilds.get(interaction.guild, 'mention_map', {})
         if not mapping:
             return await interaction.response.send_message(':information_source: Карта пуста.', ephemeral=True)
         lines = [f"**{r}**: {', '.join(ts)}" for r, ts in mapping.items()]
@@ -112,8 +486,7 @@ class MentionConfigView(View):
     @discord.ui.button(label='Перезагрузить', style=discord.ButtonStyle.success, custom_id='mention_reload')
     async def reload_map(self, interaction: discord.Interaction, button: Button):
         # Перезагрузка карты из файла
-        with open(self.cog.vars_path, 'r', encoding='utf-8') as vf:
-            self.cog.cfg = json.load(vf)
+        await self.cog.bot.config.reload(self.cog.guilds.name)
         await interaction.response.send_message(':white_check_mark: Карта перезагружена', ephemeral=True)
 
 # Модал для добавления упоминаний
@@ -126,11 +499,12 @@ class MentionAddModal(Modal):
         self.cog = cog
 
     async def on_submit(self, interaction: discord.Interaction):
-        mapping = self.cog.cfg.setdefault('mention_map', {})
         r = self.role_name.value.strip()
-        mapping[r] = [t.strip() for t in self.targets.value.split(',')]
-        with open(self.cog.vars_path, 'w', encoding='utf-8') as vf:
-            json.dump(self.cog.cfg, vf, indent=2, ensure_ascii=False)
+        targets = [t.strip() for t in self.targets.value.split(',')]
+        # Точечно обновляем индекс до публикации снимка — подписке перестраивать уже нечего
+        self.cog.mentions_for(interaction.guild).update_source(r, targets)
+        mapping = self.cog.guilds.get(interaction.guild, 'mention_map', {})
+        self.cog.guilds.set(interaction.guild, 'mention_map', {**mapping, r: targets})
         await interaction.response.send_message(f":white_check_mark: Упоминания сохранены для `{r}`", ephemeral=True)
 
 # Кнопки подачи заявок
@@ -141,57 +515,220 @@ class RequestButtons(View):
 
     @discord.ui.button(label='ICC Отпуск', style=discord.ButtonStyle.primary, custom_id='vac_icc')
     async def vac_icc(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.send_modal(VacationModal(self.cog, 'icc_vacation_channel_id', 'ICC Отпуск'))
+        await interaction.response.send_modal(VacationModal(self.cog, 'icc_vacation_channel_id', VACATION_KINDS[0]))
 
     @discord.ui.button(label='OC Отпуск', style=discord.ButtonStyle.primary, custom_id='vac_oc')
     async def vac_oc(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.send_modal(VacationModal(self.cog, 'oc_vacation_channel_id', 'OC Отпуск'))
+        await interaction.response.send_modal(VacationModal(self.cog, 'oc_vacation_channel_id', VACATION_KINDS[1]))
 
     @discord.ui.button(label='Перерыв', style=discord.ButtonStyle.secondary, custom_id='vac_break')
     async def vac_break(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.send_modal(BreakModal(self.cog, 'break_channel_id', 'Перерыв'))
+        await interaction.response.send_modal(BreakModal(self.cog, 'break_channel_id', BREAK_KIND))
 
 # Кнопки одобрения/отклонения
 class ApprovalView(View):
-    def __init__(self, message, allowed_roles):
+    """Кнопки рассмотрения для одной заявки или дайджеста из нескольких.
+
+    ``entries`` — список ``(request_id, allowed_role_ids, embed_index)`` ещё не
+    рассмотренных заявок сообщения.
+    """
+    def __init__(self, cog, entries):
         super().__init__(timeout=None)
-        self.message = message
-        self.allowed = allowed_roles
+        self.cog = cog
+        # Текущие embed'ы сообщения: решения по разным заявкам дайджеста не затирают друг друга
+        self.embeds = None
+        self._lock = asyncio.Lock()
+        multi = len(entries) > 1 or any(idx for _, _, idx in entries)
+        for rid, allowed, idx in entries:
+            suffix = f' #{idx + 1}' if multi else ''
+            row = idx // 2 if multi else None
+            # custom_id привязан к заявке, чтобы view можно было восстановить после перезапуска
+            approve = Button(label='Принять' + suffix, style=discord.ButtonStyle.success,
+                             custom_id=f'approve:{rid}', row=row)
+            deny = Button(label='Отказать' + suffix, style=discord.ButtonStyle.danger,
+                          custom_id=f'deny:{rid}', row=row)
+            approve.callback = self._callback(self.approve, rid, allowed, idx)
+            deny.callback = self._callback(self.deny, rid, allowed, idx)
+            self.add_item(approve)
+            self.add_item(deny)
+            cog.approvals[rid] = (self, idx)
 
-    @discord.ui.button(label='Принять', style=discord.ButtonStyle.success, custom_id='approve')
-    async def approve(self, interaction: discord.Interaction, button: Button):
-        if not any(r.name in self.allowed for r in interaction.user.roles):
-            return await interaction.response.send_message(':x: Нет прав', ephemeral=True)
-        embed = self.message.embeds[0]
+    @staticmethod
+    def _callback(handler, rid, allowed, idx):
+        async def callback(interaction: discord.Interaction):
+            if allowed.isdisjoint(r.id for r in interaction.user.roles):
+                return await interaction.response.send_message(':x: Нет прав', ephemeral=True)
+            await handler(interaction, rid, idx)
+        return callback
+
+    async def finish(self, message, rid, idx, embed):
+        """Обновить embed заявки и убрать её кнопки; остальные заявки дайджеста остаются.
+
+        ``message`` может быть устаревшим (модал отказа держит сообщение с момента
+        нажатия), поэтому embed'ы берутся из него только при первом решении.
+        Правка идёт через очередь отправки: не успевшая к остановке сохраняется
+        в outbox и повторяется после перезапуска, решение не теряется.
+        """
+        async with self._lock:
+            for item in [c for c in self.children if c.custom_id in (f'approve:{rid}', f'deny:{rid}')]:
+                self.remove_item(item)
+            self.cog.approvals.pop(rid, None)
+            if self.embeds is None:
+                self.embeds = list(message.embeds)
+            self.embeds[idx] = embed
+            view = self if self.children else None
+            if view is None:
+                self.stop()
+            pending = [int(c.custom_id.split(':')[1]) for c in self.children if c.custom_id.startswith('approve:')]
+            job = SendJob(message.channel, embeds=self.embeds, build_view=lambda: view, message_id=message.id,
+                          replay=('decision', {'message_id': message.id, 'pending': pending}))
+            try:
+                self.cog.bot.pipeline.submit(job)
+            except QueueFull:
+                # Очередь канала забита новыми заявками — решение показываем сразу
+                await message.edit(embeds=self.embeds, view=view)
+
+    async def approve(self, interaction: discord.Interaction, rid, idx):
+        if not self.cog.bot.store.decide(rid, 'approved', interaction.user.id):
+            return await interaction.response.send_message(':information_source: Заявка уже рассмотрена', ephemeral=True)
+        self.cog.conflicts.set_status(rid, 'approved')
+        self.cog.request_decided(rid, 'approved')
+        embed = interaction.message.embeds[idx]
         embed.color = discord.Color.green()
         embed.add_field(name='Статус', value='Одобрено', inline=False)
         embed.add_field(name='Решил', value=interaction.user.mention, inline=False)
-        await self.message.edit(embed=embed, view=None)
+        await self.finish(interaction.message, rid, idx, embed)
         await interaction.response.send_message('Заявка одобрена', ephemeral=True)
 
-    @discord.ui.button(label='Отказать', style=discord.ButtonStyle.danger, custom_id='deny')
-    async def deny(self, interaction: discord.Interaction, button: Button):
-        if not any(r.name in self.allowed for r in interaction.user.roles):
-            return await interaction.response.send_message(':x: Нет прав', ephemeral=True)
-        await interaction.response.send_modal(DenyModal(self.message))
+    async def deny(self, interaction: discord.Interaction, rid, idx):
+        await interaction.response.send_modal(DenyModal(self, interaction.message, rid, idx))
 
 # Модал для причины отказа
 class DenyModal(Modal):
     reason = TextInput(label='Причина отказа', style=discord.TextStyle.long)
 
-    def __init__(self, message):
+    def __init__(self, approval, message, request_id, embed_index):
         super().__init__(title='Причина отказа')
+        self.approval = approval
         self.message = message
+        self.request_id = request_id
+        self.embed_index = embed_index
 
     async def on_submit(self, interaction: discord.Interaction):
-        embed = self.message.embeds[0]
+        store = self.approval.cog.bot.store
+        if not store.decide(self.request_id, 'denied', interaction.user.id, self.reason.value):
+            return await interaction.response.send_message(':information_source: Заявка уже рассмотрена', ephemeral=True)
+        self.approval.cog.conflicts.remove(self.request_id)
+        self.approval.cog.request_decided(self.request_id, 'denied')
+        embed = self.message.embeds[self.embed_index]
         embed.color = discord.Color.red()
         embed.add_field(name='Статус', value='Отклонено', inline=False)
         embed.add_field(name='Решил', value=interaction.user.mention, inline=False)
         embed.add_field(name='Причина отказа', value=self.reason.value, inline=False)
-        await self.message.edit(embed=embed, view=None)
+        await self.approval.finish(self.message, self.request_id, self.embed_index, embed)
         await interaction.response.send_message('Заявка отклонена', ephemeral=True)
 
+def _attach(store, channel_id, request_ids):
+    def on_sent(msg):
+        for rid in request_ids:
+            store.attach_message(rid, channel_id, msg.id)
+    return on_sent
+
+def _failed(cog, request_ids, interaction=None):
+    async def on_failed(error):
+        # Сообщение так и не ушло: заявка не должна навсегда остаться ожидающей без кнопок
+        for rid in request_ids:
+            if cog.bot.store.decide(rid, 'failed', None, f'Не удалось опубликовать: {error}'):
+                cog.request_decided(rid, 'failed')
+                cog.conflicts.remove(rid)
+        if interaction is not None:
+            try:
+                await interaction.followup.send(':x: Не удалось опубликовать заявку, подайте её ещё раз',
+                                                ephemeral=True)
+            except discord.HTTPException:
+                pass
+    return on_failed
+
+def _fail_all(jobs):
+    async def on_failed(error):
+        for job in jobs:
+            if job.on_failed is not None:
+                await job.on_failed(error)
+    return on_failed
+
+def combine_requests(cog, jobs):
+    """Объединить несколько заявок одного канала в одно сообщение-дайджест"""
+    mentions = list(dict.fromkeys(m for job in jobs for m in job.meta['mentions']))
+    notice = f"Поступило заявок на {jobs[0].meta['kind']}: {len(jobs)}. Пожалуйста рассмотрите."
+    entries = [(job.meta['request_id'], job.meta['allowed'], i) for i, job in enumerate(jobs)]
+    return SendJob(
+        jobs[0].channel,
+        content=' '.join(mentions) + '\n' + notice,
+        embeds=[e for job in jobs for e in job.embeds],
+        build_view=lambda: ApprovalView(cog, entries),
+        on_sent=_attach(cog.bot.store, jobs[0].channel.id, [rid for rid, _, _ in entries]),
+        on_failed=_fail_all(jobs),
+        replay=('approval', [rid for rid, _, _ in entries]),
+    )
+
+def publish_request(cog, interaction, channel_key, kind, embed, *, start_ts=None, end_ts=None, reason=None,
+                    digest_key=None, dept=None):
+    """Сохранить заявку и поставить её публикацию в очередь.
+
+    Возвращает id заявки (None, если канал не настроен); QueueFull, если очередь канала заполнена.
+    """
+    notice = f"Поступила новая заявка на {kind}. Пожалуйста рассмотрите."
+    index = cog.mentions_for(interaction.guild)
+    mentions, allowed = index.resolve(interaction.guild, interaction.user.roles)
+    ch = cog.guilds.channel(interaction.guild, channel_key)
+    if not ch:
+        return None
+    pipeline = cog.bot.pipeline
+    if pipeline.is_full(ch.id):
+        raise QueueFull(ch.id)
+    if dept is None:
+        dept = index.department(interaction.user.roles)
+    rid = cog.bot.store.create(
+        guild_id=interaction.guild.id, requester_id=interaction.user.id, kind=kind,
+        start_ts=start_ts, end_ts=end_ts, allowed=sorted(allowed), reason=reason or None,
+        department=dept.name if dept else None, department_id=dept.id if dept else None
+    )
+    entries = [(rid, allowed, 0)]
+    pipeline.submit(SendJob(
+        ch,
+        content=' '.join(mentions) + '\n' + notice,
+        embeds=[embed],
+        build_view=lambda: ApprovalView(cog, entries),
+        on_sent=_attach(cog.bot.store, ch.id, [rid]),
+        on_failed=_failed(cog, [rid], interaction),
+        digest_key=digest_key,
+        meta={'request_id': rid, 'allowed': allowed, 'mentions': mentions, 'kind': kind},
+        replay=('approval', [rid]),
+    ))
+    cog.track_request(rid, end_ts)
+    return rid
+
+def conflict_fields(cog, embed, guild, dept, requester_id, start_ts, end_ts):
+    """Добавить в embed пересекающиеся отсутствия отдела и процент покрытия"""
+    overlaps = cog.conflicts.check(guild.id, dept.name, start_ts, end_ts)
+    absent = {a.requester_id for a in overlaps} | {requester_id}
+    lines = [f"<@{a.requester_id}> {datetime.fromtimestamp(a.start_ts):%d.%m}–"
+             f"{datetime.fromtimestamp(a.end_ts - 1):%d.%m} ({'одобрено' if a.status == 'approved' else 'ожидает'})"
+             for a in overlaps[:10]]
+    if len(overlaps) > 10:
+        lines.append(f'…и ещё {len(overlaps) - 10}')
+    embed.add_field(name=f'Пересечения ({dept.name})', value='\n'.join(lines) or 'Нет', inline=False)
+    # Без полного списка участников (intent members и chunk) в кэше лишь часть отдела —
+    # процент был бы неверным, поэтому показываем только число отсутствующих
+    members = {m.id for m in getattr(dept, 'members', ())} if guild.chunked else set()
+    if members:
+        # Ушедшие из отдела после подачи заявки в процент не входят
+        away = len(absent & members)
+        coverage = (len(members) - away) * 100 // len(members)
+        embed.add_field(name='Покрытие', value=f'{coverage}% (отсутствуют {away} из {len(members)})', inline=False)
+    else:
+        embed.add_field(name='Покрытие', value=f'отсутствуют {len(absent)}', inline=False)
+
 # Модали подачи заявок
 class VacationModal(Modal):
     start_date = TextInput(label='Дата начала (DD.MM.YYYY)')
@@ -206,8 +743,14 @@ class VacationModal(Modal):
 
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
-        sd = datetime.strptime(self.start_date.value, '%d.%m.%Y')
-        ed = datetime.strptime(self.end_date.value, '%d.%m.%Y')
+        try:
+            sd = datetime.strptime(self.start_date.value.strip(), '%d.%m.%Y')
+            ed = datetime.strptime(self.end_date.value.strip(), '%d.%m.%Y')
+        except ValueError:
+            return await interaction.followup.send(':x: Даты нужно указать в формате DD.MM.YYYY', ephemeral=True)
+        # Перевёрнутый период не пройдёт интервальный индекс хранилища и проверку пересечений
+        if ed < sd:
+            return await interaction.followup.send(':x: Дата окончания раньше даты начала', ephemeral=True)
         days = (ed - sd).days + 1
         embed = discord.Embed(title=f'Новая заявка ({self.title_short})', color=discord.Color.blue())
         embed.set_footer(text='by ZICteam')
@@ -217,20 +760,18 @@ class VacationModal(Modal):
         embed.add_field(name='Длительность', value=f'{days} дн.', inline=False)
         embed.add_field(name='Причина', value=self.reason.value or 'Не указана', inline=False)
         embed.add_field(name='Время заявки', value=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), inline=False)
-        notice = f"Поступила новая заявка на {self.title_short}. Пожалуйста рассмотрите."
-        mapping = self.cog.cfg.get('mention_map', {})
-        allowed, mentions = [], []
-        for role in interaction.user.roles:
-            for tgt in mapping.get(role.name, []):
-                r = discord.utils.get(interaction.guild.roles, name=tgt)
-                if r:
-                    mentions.append(r.mention)
-                    allowed.append(r.name)
-        ch = self.cog.bot.get_channel(self.cog.cfg.get(self.channel_key))
-        view = ApprovalView(None, allowed)
-        if ch:
-            msg = await ch.send(content=' '.join(dict.fromkeys(mentions)) + '\n' + notice, embed=embed, view=view)
-            view.message = msg
+        start_ts, end_ts = sd.timestamp(), (ed + timedelta(days=1)).timestamp()
+        dept = self.cog.mentions_for(interaction.guild).department(interaction.user.roles)
+        if dept is not None:
+            conflict_fields(self.cog, embed, interaction.guild, dept, interaction.user.id, start_ts, end_ts)
+        try:
+            rid = publish_request(self.cog, interaction, self.channel_key, self.title_short, embed,
+                                  start_ts=start_ts, end_ts=end_ts, reason=self.reason.value, dept=dept)
+        except QueueFull:
+            return await interaction.followup.send(':x: Слишком много заявок, попробуйте через минуту', ephemeral=True)
+        if rid is not None and dept is not None:
+            self.cog.conflicts.add(RequestRecord(rid, interaction.user.id, self.title_short, start_ts=start_ts,
+                                                 end_ts=end_ts, department=dept.name, guild_id=interaction.guild.id))
         await interaction.followup.send('Заявка отправлена', ephemeral=True)
 
 class BreakModal(Modal):
@@ -248,6 +789,7 @@ class BreakModal(Modal):
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         fmt = '%H:%M'
+        start_ts = end_ts = None
         try:
             start = datetime.strptime(self.start_time.value, fmt)
             end = datetime.strptime(self.end_time.value, fmt)
@@ -255,6 +797,9 @@ class BreakModal(Modal):
                 end += timedelta(days=1)
             delta = end - start
             minutes = delta.seconds // 60
+            today = datetime.combine(datetime.now().date(), start.time())
+            start_ts = today.timestamp()
+            end_ts = start_ts + delta.total_seconds()
         except Exception:
             minutes = 0
         embed = discord.Embed(title=f'Новая заявка ({self.title_short})', color=discord.Color.orange())
@@ -271,20 +816,11 @@ class BreakModal(Modal):
         embed.add_field(name='Длительность', value=duration_str, inline=False)
         embed.add_field(name='Причина', value=self.reason.value or 'Не указана', inline=False)
         embed.add_field(name='Время заявки', value=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), inline=False)
-        notice = f"Поступила новая заявка на {self.title_short}. Пожалуйста рассмотрите."
-        mapping = self.cog.cfg.get('mention_map', {})
-        allowed, mentions = [], []
-        for role in interaction.user.roles:
-            for tgt in mapping.get(role.name, []):
-                r = discord.utils.get(interaction.guild.roles, name=tgt)
-                if r:
-                    mentions.append(r.mention)
-                    allowed.append(r.name)
-        ch = self.cog.bot.get_channel(self.cog.cfg.get(self.channel_key))
-        view = ApprovalView(None, allowed)
-        if ch:
-            msg = await ch.send(content=' '.join(dict.fromkeys(mentions)) + '\n' + notice, embed=embed, view=view)
-            view.message = msg
+        try:
+            publish_request(self.cog, interaction, self.channel_key, self.title_short, embed,
+                            start_ts=start_ts, end_ts=end_ts, reason=self.reason.value, digest_key='break')
+        except QueueFull:
+            return await interaction.followup.send(':x: Слишком много заявок, попробуйте через минуту', ephemeral=True)
         await interaction.followup.send('Заявка на перерыв отправлена', ephemeral=True)
 
 async def setup(bot):